@@ -14,7 +14,8 @@ module cic_d
     parameter EXACT_SCALING = 1,
     parameter PRG_SCALING = 0,
     parameter NUM_SHIFT = 5*CIC_N,
-    parameter USE_DSP = 1
+    parameter USE_DSP = 1,
+    parameter SCALING_LUT_FILE = ""  // $readmemh file with the scaling LUT if VAR_RATE = 1 and PRG_SCALING = 0, see tools/calculate_scaling_lut.py
 )
 /*********************************************************************************************/
 (
@@ -98,6 +99,7 @@ if  (!PRG_SCALING && VAR_RATE) begin
     assign downsampler_rate_valid = s_axis_rate_tvalid;
     (* ram_style = "distributed" *) reg unsigned [SCALING_FACTOR_WIDTH-1:0]         LUT  [1:CIC_R];
     (* ram_style = "distributed" *) reg unsigned [EXACT_SCALING_FACTOR_WIDTH-1:0]   LUT2 [1:CIC_R];
+    reg unsigned [EXACT_SCALING_FACTOR_WIDTH+SCALING_FACTOR_WIDTH-1:0] LUT_FILE [1:CIC_R];
     initial begin
         // this LUT calculation in verilog is limited, it works for R=4095, N=6, M=1
         // if larger values are needed, do LUT calculation outside verilog, ie python
@@ -106,7 +108,15 @@ if  (!PRG_SCALING && VAR_RATE) begin
         reg unsigned [127:0] post_mult;
         reg unsigned [clog2_l(CIC_R):0] small_r;
         $display("R = %d  N = %d  M = %d  INP_DW = %d  OUT_DW = %d  NUM_SHIFT = %d", CIC_R, CIC_N, CIC_N, INP_DW, OUT_DW, NUM_SHIFT_HELPER);
-        for(integer r=1;r<=CIC_R;r++) begin
+        if (SCALING_LUT_FILE != "") begin
+            // every line is {mult_number, shift_number} for the rates 1..CIC_R, this is much faster to elaborate
+            $readmemh(SCALING_LUT_FILE, LUT_FILE);
+            for(integer r=1;r<=CIC_R;r++) begin
+                LUT[r] = LUT_FILE[r][SCALING_FACTOR_WIDTH-1:0];
+                LUT2[r] = LUT_FILE[r][SCALING_FACTOR_WIDTH +: EXACT_SCALING_FACTOR_WIDTH];
+            end
+        end
+        else for(integer r=1;r<=CIC_R;r++) begin
             small_r = r[clog2_l(CIC_R):0];
             gain_diff = (((128'(CIC_R) << (NUM_SHIFT_HELPER / CIC_N)) / 128'(r)) ** CIC_N);
             pre_shift = flog2_l(gain_diff >> (NUM_SHIFT_HELPER)); 
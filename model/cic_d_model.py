@@ -1,8 +1,237 @@
 import math
+import os
+import sys
+import time
+import pickle
+import functools
+import importlib.util
+import concurrent.futures
 import numpy as np
+from multiprocessing import shared_memory
+from collections import deque
+from numpy.lib.stride_tricks import sliding_window_view
+
+MASK_32 = np.uint64((1 << 32) - 1)
+
+# the tools are only loaded once, so their in-memory caches are kept between Model instances
+@functools.lru_cache(maxsize=None)
+def load_tool(name):
+    tools_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), f'../tools/{name}.py'))
+    spec = importlib.util.spec_from_file_location(name, tools_dir)
+    foo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(foo)
+    return foo
+
+def wrap_int(value, width):
+    return ((value + (1 << (width - 1))) & ((1 << width) - 1)) - (1 << (width - 1))
+
+# this file as a module with the name of the file that is registered in sys.modules, the functions that
+# process_parallel() sends to its worker processes are taken from it, so they can be pickled also if the caller
+# loaded the file with importlib without registering it, spawned workers import it from sys.path
+@functools.lru_cache(maxsize=None)
+def load_worker_module():
+    model_dir, file_name = os.path.split(os.path.abspath(__file__))
+    name = os.path.splitext(file_name)[0]
+    if model_dir not in sys.path:
+        sys.path.append(model_dir)
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(model_dir, file_name))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+# model and samples of a worker process of process_parallel()
+parallel_worker = {}
+
+# initializer of the worker processes, the model is rebuilt from its state and the samples are
+# mapped from the shared memory of the caller without a copy
+def init_parallel_worker(state, shm_name, shape, dtype):
+    model = Model.__new__(Model)
+    model.__setstate__(state)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    parallel_worker.update(model=model, shm=shm, samples=np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+# decimates the samples start ... end-1 (on the time axis) in a worker process
+def parallel_block(start, end, time_axis):
+    samples = parallel_worker["samples"]
+    index = [slice(None)] * samples.ndim
+    index[time_axis] = slice(start, end)
+    return parallel_worker["model"].process_block(samples[tuple(index)])
+
+# array of integers modulo 2**width, stored unsigned (two's complement)
+# width <= 63: one uint64 word per value
+# width > 63:  32-bit digits in several uint64 words, the free upper bits of every word collect the
+#              carries of a cumulative sum, so up to 2**32 values can be summed before normalizing
+class WideArray:
+    def __init__(self, digits, width):
+        self.digits = digits  # shape (number of digits, ..., number of values)
+        self.width = width
+
+    @staticmethod
+    def num_digits(width):
+        return 1 if width <= 63 else (width + 31) // 32
+
+    def single(self):
+        return self.digits.shape[0] == 1
+
+    def top_mask(self):
+        if self.single():
+            return np.uint64((1 << self.width) - 1)
+        return np.uint64((1 << (self.width - 32 * (self.digits.shape[0] - 1))) - 1)
+
+    @classmethod
+    def from_int(cls, values, width):
+        values = np.asarray(values, dtype=np.int64).astype(np.uint64)
+        return cls(values[np.newaxis], 64).resize(width)
+
+    @classmethod
+    def from_digits(cls, digits, width):
+        if width <= 63:
+            return cls((digits[0] | (digits[1] << np.uint64(32)))[np.newaxis], width).normalize()
+        return cls(digits[:cls.num_digits(width)], width).normalize()
+
+    def to_int(self):
+        assert self.width <= 63, f"width {self.width} does not fit into int64"
+        value = self.digits[0]
+        sign = (value >> np.uint64(self.width - 1)) & np.uint64(1)
+        return value.astype(np.int64) - (sign.astype(np.int64) << np.int64(self.width))
+
+    # python integers, for any width
+    def to_object(self):
+        if self.width <= 63:
+            return self.to_int().astype(object)
+        digits = self.to_digits()
+        value = np.zeros(digits.shape[1:], dtype=object)
+        for i in np.arange(digits.shape[0]):
+            value = value + (digits[i].astype(object) << (32 * int(i)))
+        return value - (self.sign().astype(object) << self.width)
+
+    @staticmethod
+    def concatenate(arrays):
+        width = arrays[0].width
+        return WideArray(np.concatenate([array.resize(width).digits for array in arrays], axis=-1), width)
+
+    def __len__(self):
+        return self.digits.shape[-1]
+
+    # indexes the last axis
+    def __getitem__(self, index):
+        return WideArray(self.digits[..., index], self.width)
+
+    def normalize(self):
+        for i in np.arange(self.digits.shape[0] - 1):
+            self.digits[i + 1] += self.digits[i] >> np.uint64(32)
+            self.digits[i] &= MASK_32
+        self.digits[-1] &= self.top_mask()
+        return self
+
+    # at least two 32-bit digits, also for the single word representation
+    def to_digits(self):
+        if self.single():
+            return np.stack((self.digits[0] & MASK_32, self.digits[0] >> np.uint64(32)))
+        return self.digits
+
+    def sign(self):
+        digits = self.to_digits()
+        return (digits[(self.width - 1) // 32] >> np.uint64((self.width - 1) % 32)) & np.uint64(1)
+
+    # sign extension to a larger width, keeps the lower bits for a smaller width
+    def resize(self, width):
+        if width == self.width:
+            return self
+        sign = self.sign()
+        digits = np.zeros((max(self.num_digits(width), 2),) + self.digits.shape[1:], dtype=np.uint64)
+        num = min(len(digits), len(self.to_digits()))
+        digits[:num] = self.to_digits()[:num]
+        if width > self.width:
+            top = self.width // 32
+            if top < len(digits):
+                digits[top] |= sign * ((~np.uint64(0) << np.uint64(self.width % 32)) & MASK_32)
+                digits[top + 1:] = sign * MASK_32
+        return self.from_digits(digits, width)
+
+    def cumsum(self):
+        return WideArray(np.cumsum(self.digits, axis=-1, dtype=np.uint64), self.width).normalize()
+
+    def __sub__(self, other):
+        if self.single():
+            return WideArray(self.digits - other.digits, self.width).normalize()
+        # a - b = a + ~b + 1
+        digits = self.digits + (MASK_32 - other.digits)
+        digits[0] += np.uint64(1)
+        return WideArray(digits, self.width).normalize()
+
+    # keeps the upper width - num bits, this is what the hdl does when it throws away LSBs
+    def shr(self, num):
+        if num == 0:
+            return self
+        if self.single():
+            return WideArray(self.digits >> np.uint64(num), self.width - num).normalize()
+        q, r = divmod(num, 32)
+        digits = np.zeros((max(self.num_digits(self.width - num), 2),) + self.digits.shape[1:], dtype=np.uint64)
+        for i in np.arange(min(len(digits), self.digits.shape[0] - q)):
+            digits[i] = self.digits[i + q] >> np.uint64(r)
+            if r > 0 and i + q + 1 < self.digits.shape[0]:
+                digits[i] |= (self.digits[i + q + 1] << np.uint64(32 - r)) & MASK_32
+        return self.from_digits(digits, self.width - num)
+
+    # shift left within the same width
+    def shl(self, num):
+        if num == 0:
+            return self
+        if self.single():
+            return WideArray(self.digits << np.uint64(num), self.width).normalize()
+        q, r = divmod(num, 32)
+        digits = np.zeros_like(self.digits)
+        for i in np.arange(q, self.digits.shape[0]):
+            digits[i] = (self.digits[i - q] << np.uint64(r)) & MASK_32
+            if r > 0 and i - q - 1 >= 0:
+                digits[i] |= self.digits[i - q - 1] >> np.uint64(32 - r)
+        return WideArray(digits, self.width).normalize()
+
+    # multiplication with a non-negative python integer, modulo 2**width
+    def mul(self, factor):
+        if self.single():
+            return WideArray(self.digits * np.uint64(factor & ((1 << 64) - 1)), self.width).normalize()
+        digits = np.zeros_like(self.digits)
+        num_digits = self.digits.shape[0]
+        for k in np.arange(num_digits):
+            factor_digit = np.uint64((factor >> (32 * int(k))) & ((1 << 32) - 1))
+            if factor_digit == 0:
+                continue
+            for i in np.arange(num_digits - k):
+                product = self.digits[i] * factor_digit
+                digits[i + k] += product & MASK_32
+                if i + k + 1 < num_digits:
+                    digits[i + k + 1] += product >> np.uint64(32)
+        return WideArray(digits, self.width).normalize()
 
 class Model:
-    def __init__(self, R, N ,M, INP_DW, OUT_DW, VAR_RATE, EXACT_SCALING, register_pruning=1):
+    # engine="taps"      keeps the full R*M*N tap history and recomputes every moving sum each clock
+    # engine="recursive" keeps N integrators and N comb delay lines like the hdl (Hogenauer structure),
+    #                    cost per clock does not depend on R
+    # engine="polyphase" keeps the last N*(R*M-1)+1 inputs and evaluates the equivalent FIR filter only
+    #                    for the outputs that are kept, cost scales with the output rate
+    # engine="pruned"    bit-true model of the hdl data path, every stage throws away LSBs like PRUNE_BITS
+    #                    in cic_d.sv (prune_bits = B_j from calculate_register_pruning() if not given,
+    #                    no pruning if register_pruning = 0) and the output is scaled in fixed point
+    #                    like the hdl, NUM_SHIFT defaults to 5*N like in cic_d.sv when PRG_SCALING = 0
+    # process_block() and push() also accept multichannel input, all channels share the parameters and
+    # the scaling like a time multiplexed hdl instance
+    # layout="channel_major" input and output have the shape (channels, samples)
+    # layout="sample_major"  input and output have the shape (samples, channels), the channels of a sample are
+    #                        next to each other in memory like in a time multiplexed stream
+    # verbose=False          suppresses the messages of report(), e.g. B_max
+    # profile=True           counts ticks, valid inputs and outputs and measures the time spent in tick(), see stats()
+    def __init__(self, R, N ,M, INP_DW, OUT_DW, VAR_RATE, EXACT_SCALING, register_pruning=1, engine="taps", prune_bits=None, NUM_SHIFT=None, layout="channel_major", verbose=True, profile=False):
+        assert engine in ("taps", "recursive", "polyphase", "pruned"), f"unknown engine {engine}"
+        assert layout in ("channel_major", "sample_major"), f"unknown layout {layout}"
+        self.engine = engine
+        self.layout = layout
+        self.verbose = verbose
+        self.profile = profile
+        self.CIC_R = R  # maximum rate if VAR_RATE = 1, the hdl registers are sized for it
         self.R = R
         self.N = N
         self.M = M
@@ -11,16 +240,18 @@ class Model:
         self.register_pruning = register_pruning
         self.VAR_RATE = VAR_RATE
         self.EXACT_SCALING = EXACT_SCALING
+        self.NUM_SHIFT = NUM_SHIFT if NUM_SHIFT is not None else 5 * N
 
-        self.cic_taps = np.zeros(R * M * N)
         self.cic_push_ptr = 0
         self.data_in_buf = 0
         
+        # the decimation counter sees the valid strobe of an input extra_delay - 1 clocks later, when
+        # its sample has reached the last integrator stage of tick_taps (see reset_engine)
         if VAR_RATE:
-            self.extra_delay   = self.N     
+            self.extra_delay   = max(self.N - 2, 0) + 1
             self.extra_delay_2 = 4 + (self.N-1)*1 
         else:
-            self.extra_delay   = self.N            
+            self.extra_delay   = max(self.N - 2, 0) + 1
             self.extra_delay_2 = 4 + (self.N-1)*1 
             
         self.data_out_buf = np.zeros(self.extra_delay+1)
@@ -28,12 +259,143 @@ class Model:
         self.out_valid = np.zeros(self.extra_delay+1)
         self.out_valid_2 = np.zeros(self.extra_delay_2+1)
         self.in_valid = 0
-        self.decimation_counter = 0
 
-        self.CIC_Filter_Gain = (self.R*self.M)**self.N        
-        Num_of_Bits_Growth = np.ceil(math.log2(self.CIC_Filter_Gain))
-        self.Num_Output_Bits_Without_Truncation = Num_of_Bits_Growth + self.INP_DW 
-        print(f"B_max: {self.Num_Output_Bits_Without_Truncation}")
+        self.set_gain()
+        self.report(f"B_max: {self.Num_Output_Bits_Without_Truncation}")
+        if engine == "pruned":
+            self.prune_bits = self.get_prune_bits(prune_bits)
+        self.reset_engine()
+        self.reset_stats()
+        if profile:
+            self.enable_profiling()
+
+    # all messages of the model go through here
+    def report(self, message):
+        if self.verbose:
+            print(message)
+
+    # the instrumentation replaces the hot path methods of this instance with timed wrappers,
+    # so a model without profile=True runs the plain class methods without any overhead
+    def enable_profiling(self):
+        self.disable_profiling()
+        self.profile = True
+        def timed(method, name):
+            def wrapper(*args):
+                start = time.perf_counter()
+                ret = method(*args)
+                self.profile_times[name] += time.perf_counter() - start
+                return ret
+            return wrapper
+        tick = self.tick
+        def counted_tick():
+            self.profile_counters["valid_inputs"] += self.in_valid
+            tick()
+            self.profile_counters["ticks"] += 1
+            self.profile_counters["valid_outputs"] += self.data_valid()
+        self.tick = counted_tick
+        engine_tick = f"tick_{self.engine}"
+        setattr(self, engine_tick, timed(getattr(self, engine_tick), "stages"))
+        self.get_scaled_data = timed(self.get_scaled_data, "scaling")
+        self.shift_output = timed(self.shift_output, "delay_lines")
+
+    def disable_profiling(self):
+        self.profile = False
+        for name in ("tick", f"tick_{self.engine}", "get_scaled_data", "shift_output"):
+            self.__dict__.pop(name, None)
+
+    def reset_stats(self):
+        self.profile_counters = dict(ticks=0, valid_inputs=0, valid_outputs=0)
+        self.profile_times = dict(stages=0.0, scaling=0.0, delay_lines=0.0)
+
+    # snapshot of the counters and the cumulative times in s, they are only updated with profile=True
+    def stats(self):
+        return dict(self.profile_counters, **{f"{name}_time": value for name, value in self.profile_times.items()})
+
+    def report_stats(self):
+        stats = self.stats()
+        self.report(" ".join(f"{name}: {value:.6g}" if isinstance(value, float) else f"{name}: {value}" for name, value in stats.items()))
+
+    # the wrappers cannot be pickled (process_parallel() sends the model to the workers), they are recreated
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ("tick", f"tick_{self.engine}", "get_scaled_data", "shift_output"):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.profile:
+            self.enable_profiling()
+
+    # number of LSBs that are thrown away by every stage like PRUNE_BITS in cic_d.sv
+    # index 0 is the input, 1..N the integrators, N+1..2N the combs and 2N+1 the output
+    def get_prune_bits(self, prune_bits):
+        Gain_max = (self.CIC_R * self.M)**self.N
+        self.B_max_hdl = (Gain_max - 1).bit_length() + self.INP_DW  # clog2_l() in cic_functions.vh
+        # with R*M = 1 there is no bit growth and F_1 = 0 has no finite B_1, nothing is pruned then
+        if prune_bits is None and self.register_pruning and self.CIC_R * self.M > 1:
+            prune_bits = load_tool("calculate_register_pruning").calculate_register_pruning(self.CIC_R, self.N, self.M, self.INP_DW, self.OUT_DW, verbose=False)
+        elif prune_bits is None:
+            prune_bits = [0] * (2*self.N + 1) + [self.B_max_hdl - self.OUT_DW]
+        # the hdl never prunes the input
+        return [0] + [int(prune_bits[i]) for i in range(1, 2*self.N + 2)]
+
+    # pre shift and exact scaling factor like cic_d.sv calculates them if PRG_SCALING = 0
+    def get_default_scaling(self):
+        Gain_max = (self.CIC_R * self.M)**self.N
+        if not self.VAR_RATE:
+            return 0, ((1 << (Gain_max - 1).bit_length()) << self.NUM_SHIFT) // Gain_max
+        # LUT calculation in cic_d.sv, it uses 128 bit arithmetic
+        shift_number, mult_number = load_tool("calculate_scaling_lut").calculate_scaling_lut(self.CIC_R, self.N, self.M, self.NUM_SHIFT)
+        return int(shift_number[self.R]), int(mult_number[self.R])
+
+    # programmable scaling like the config registers of cic_d.sv when PRG_SCALING = 1,
+    # the pre shift is only used if VAR_RATE = 1 like in the hdl, reset() restores the default scaling
+    def set_scaling(self, shift_number, mult_number):
+        self.pre_shift = shift_number
+        self.exact_scaling_factor = mult_number
+
+    def reset_engine(self):
+        # integrator stages after the second one add one clock of delay each, see tick_taps
+        self.delay = max(self.N - 2, 0)
+        self.reset_block()
+        # the decimation counter fires on the inputs of the block grid first_out, first_out + R, ...,
+        # the start value is negative if the first output needs more than R valid inputs (R = 1)
+        first_out = (self.N - 1) + (self.R - 2) % self.R - self.delay
+        self.decimation_counter = self.R - 2 - first_out
+        if self.engine == "taps":
+            self.cic_taps = np.zeros(self.R * self.M * self.N)
+            return
+        # the recursive and polyphase engines only calculate the decimated stream, decimation_phase
+        # reaches 0 on every input where the decimation counter selects an output
+        # (and on the inputs R, 2R, ... before the first one)
+        self.decimation_phase = -first_out % self.R
+        self.cic_out = 0
+        if self.engine in ("recursive", "pruned"):
+            # integrators and combs wrap around at B_max bits like the registers in the hdl
+            self.integrators = [0] * self.N
+            self.comb_delays = [deque([0] * self.M, maxlen=self.M) for i in range(self.N)]
+            if self.engine == "pruned":
+                self.set_scaling(*self.get_default_scaling())
+        else:
+            self.fir_coefficients = self.get_fir_coefficients()
+            # every input is written twice, so the last fir_len inputs are always a contiguous slice
+            self.fir_len = len(self.fir_coefficients)
+            self.fir_history = np.zeros(2 * self.fir_len, dtype=self.dtype)
+            self.fir_ptr = 0
+
+    # impulse response of the equivalent FIR filter, (1 - z^-RM)^N / (1 - z^-1)^N
+    def get_fir_coefficients(self):
+        h = np.zeros(self.N * (self.R*self.M - 1) + 1, dtype=self.dtype)
+        h[0] = 1
+        for i_s in np.arange(self.N):
+            h = np.cumsum(h)
+        for i_s in np.arange(self.N):
+            h = h - np.concatenate((np.zeros(min(self.R*self.M, len(h)), dtype=self.dtype), h[:-self.R*self.M]))
+        return h
+
+    def wrap(self, value):
+        return ((value + (1 << (self.B_max - 1))) & ((1 << self.B_max) - 1)) - (1 << (self.B_max - 1))
 
     def cic_model_stage_get_out(self, stage):
         ret = 0
@@ -51,20 +413,100 @@ class Model:
         self.in_valid = 1
         
     def reset(self):
-        self.decimation_counter = 0
         self.cic_push_ptr = 0
         self.data_in_buf = 0       
         self.in_valid = 0
-        self.cic_taps = np.zeros(self.R * self.M * self.N)        
         self.data_out_buf = np.zeros(self.extra_delay+1)
         self.data_out_buf_2 = np.zeros(self.extra_delay_2+1)
         self.out_valid = np.zeros(self.extra_delay+1)
         self.out_valid_2 = np.zeros(self.extra_delay_2+1)        
-        self.CIC_Filter_Gain = (self.R*self.M)**self.N        
+        self.set_gain()
+        self.reset_engine()
+
+    # gain and register width of the current rate
+    def set_gain(self):
+        self.CIC_Filter_Gain = (self.R*self.M)**self.N
         self.Num_of_Bits_Growth = np.ceil(math.log2(self.CIC_Filter_Gain))
-        self.Num_Output_Bits_Without_Truncation = self.Num_of_Bits_Growth + self.INP_DW        
+        self.Num_Output_Bits_Without_Truncation = self.Num_of_Bits_Growth + self.INP_DW
+        self.B_max = int(self.Num_Output_Bits_Without_Truncation)
+        # int64 wraps around like the hdl registers, this is fine as long as the result fits into 64 bits
+        self.dtype = np.int64 if self.B_max <= 64 else object
         
     def tick(self):
+        if self.engine == "recursive":
+            self.tick_recursive()
+        elif self.engine == "polyphase":
+            self.tick_polyphase()
+        elif self.engine == "pruned":
+            self.tick_pruned()
+        else:
+            self.tick_taps()
+        self.tick_output()
+
+    def tick_recursive(self):
+        if self.in_valid == 1:
+            # all stages see the new sample in the same clock, so the output of an input is calculated
+            # in its own clock, like in the hdl the integrators and the combs hold their state while no
+            # valid input arrives
+            self.integrators[0] = self.wrap(self.integrators[0] + self.data_in_buf)
+            for i_s in range(1, self.N):
+                self.integrators[i_s] = self.wrap(self.integrators[i_s] + self.integrators[i_s - 1])
+            if self.decimation_phase == 0:
+                ret = self.integrators[self.N - 1]
+                for delay in self.comb_delays:
+                    delayed = delay[0]
+                    delay.append(ret)
+                    ret = self.wrap(ret - delayed)
+                self.cic_out = ret
+            self.decimation_phase = self.decimation_phase + 1 if self.decimation_phase < self.R - 1 else 0
+            self.out_valid[0] = 1
+            self.in_valid = 0
+
+    def tick_polyphase(self):
+        if self.in_valid == 1:
+            self.fir_history[self.fir_ptr] = self.data_in_buf
+            self.fir_history[self.fir_ptr + self.fir_len] = self.data_in_buf
+            self.fir_ptr = self.fir_ptr + 1 if self.fir_ptr < self.fir_len - 1 else 0
+            if self.decimation_phase == 0:
+                # oldest input first
+                window = self.fir_history[self.fir_ptr:self.fir_ptr + self.fir_len]
+                self.cic_out = int(np.dot(window, self.fir_coefficients[::-1]))
+            self.decimation_phase = self.decimation_phase + 1 if self.decimation_phase < self.R - 1 else 0
+            self.out_valid[0] = 1
+            self.in_valid = 0
+
+    def tick_pruned(self):
+        if self.in_valid == 1:
+            B = self.prune_bits
+            value = wrap_int(self.data_in_buf, self.B_max_hdl - B[0])
+            if self.VAR_RATE:
+                value = wrap_int(value << self.pre_shift, self.B_max_hdl - B[0])
+            # same order as in tick_recursive, the accumulators are max(idw, odw) bits wide and
+            # the upper odw bits are passed to the next stage
+            self.integrators[0] = wrap_int(self.integrators[0] + value, self.B_max_hdl - min(B[0], B[1]))
+            for i_s in range(1, self.N):
+                value = self.integrators[i_s - 1] >> max(B[i_s] - B[i_s - 1], 0)
+                self.integrators[i_s] = wrap_int(self.integrators[i_s] + value, self.B_max_hdl - min(B[i_s], B[i_s + 1]))
+            if self.decimation_phase == 0:
+                ret = self.integrators[self.N - 1] >> max(B[self.N] - B[self.N - 1], 0)
+                for j, delay in enumerate(self.comb_delays):
+                    delayed = delay[0]
+                    delay.append(ret)
+                    ret = wrap_int(ret - delayed, self.B_max_hdl - B[self.N + j]) >> max(B[self.N + j + 1] - B[self.N + j], 0)
+                self.cic_out = self.scale_pruned(ret)
+            self.decimation_phase = self.decimation_phase + 1 if self.decimation_phase < self.R - 1 else 0
+            self.out_valid[0] = 1
+            self.in_valid = 0
+
+    # output stage of cic_d.sv, value is the output of the last comb
+    def scale_pruned(self, value):
+        dw_out = self.B_max_hdl - self.prune_bits[2*self.N]
+        if self.EXACT_SCALING:
+            return wrap_int((value * self.exact_scaling_factor) >> (self.NUM_SHIFT + dw_out - self.OUT_DW), self.OUT_DW)
+        # like the model, there is no shift if the output is wider than the last comb
+        return wrap_int(value >> max(dw_out - self.OUT_DW, 0), self.OUT_DW)
+
+    def tick_taps(self):
 
         if self.in_valid == 1:
             self.cic_taps[self.cic_push_ptr] = self.data_in_buf
@@ -76,12 +518,22 @@ class Model:
         for i_s in np.arange(self.N-1,0,-1):
             self.cic_taps[self.cic_push_ptr + i_s * self.R*self.M] = self.cic_model_stage_get_out(i_s - 1)
 
-        
-        self.data_out_buf[0] = self.get_scaled_data()
-        for i in np.arange(self.extra_delay-1,-1,-1):
-            self.data_out_buf[i+1] = self.data_out_buf[i]
-            self.out_valid[i+1] = self.out_valid[i]  # not used        
-        
+    def tick_output(self):
+        self.shift_output(self.get_scaled_data())
+
+    # output delay lines and decimation counter
+    # like the valid_out registers of the integrator stages the valid strobe of an input moves one stage
+    # every clock, with or without new input, and the counter of downsampler.sv only counts the strobes,
+    # so an output appears a fixed number of clocks after the input that completes it
+    # tick_taps needs extra_delay - 1 clocks until an input has reached its last stage, the other engines
+    # calculate the output in the clock of the input, their data is delayed together with the strobe
+    def shift_output(self, data):
+        self.data_out_buf[0] = data
+        # every entry moves by one, the new value ends up in index 0 and 1
+        self.data_out_buf[1:] = self.data_out_buf[:-1]
+        self.out_valid[1:] = self.out_valid[:-1]
+        self.out_valid[0] = 0
+
         if self.out_valid[self.extra_delay]:
             self.decimation_counter = self.decimation_counter + 1 if self.decimation_counter < (self.R-1) else 0
                     
@@ -90,12 +542,29 @@ class Model:
         else:
             self.out_valid_2[0] = 0
             
-        self.data_out_buf_2[0] = self.data_out_buf[0]
-        for i in np.arange(self.extra_delay_2-1,-1,-1):
-            self.data_out_buf_2[i+1] = self.data_out_buf_2[i]
-            self.out_valid_2[i+1] = self.out_valid_2[i]
-            
-    
+        self.data_out_buf_2[0] = self.data_out_buf[1 if self.engine == "taps" else self.extra_delay]
+        self.data_out_buf_2[1:] = self.data_out_buf_2[:-1]
+        self.out_valid_2[1:] = self.out_valid_2[:-1]
+
+    # clocks the model for n_cycles cycles without valid input (a pending set_data() is used in the first one),
+    # returns the cycle numbers (0 = first cycle) after which data_valid() was true and the outputs
+    # the first cycles are clocked with tick() until the strobes of the last inputs have left the output
+    # pipeline, so their outputs appear at the same clocks as with tick(), after that no state changes
+    # without valid input and the remaining cycles are skipped
+    def advance(self, n_cycles):
+        cycles = []
+        outputs = []
+        num_tick = min(n_cycles, self.extra_delay + self.extra_delay_2)
+        for cycle in range(num_tick):
+            self.tick()
+            if self.data_valid():
+                cycles.append(cycle)
+                outputs.append(self.get_data())
+        if self.profile:
+            # the skipped cycles count like ticks without valid input and output
+            self.profile_counters["ticks"] += n_cycles - num_tick
+        return np.array(cycles, dtype=np.int64), np.array(outputs)
+
     # moving average is calculated for every sample of fast clock, but only every Rth sample is used for output
     def data_valid(self):
         if self.out_valid_2[self.extra_delay_2] == 1:
@@ -105,13 +574,329 @@ class Model:
     def get_data(self):
         return self.data_out_buf_2[self.extra_delay_2]
 
+    # decimates a whole block of samples as if they were clocked into a freshly reset model one per clock,
+    # returns every output for which the decimation counter fires while the block is clocked in
+    # the integrators become cumulative sums and the combs differences on the decimated stream
+    def process_block(self, samples):
+        self.reset_block()
+        return self.push(samples)
+
+    # state of push(), it is independent of the state used by tick()
+    def reset_block(self):
+        self.block_samples = 0
+        self.block_integrators = None
+        self.block_combs = None
+        self.block_history = None
+        self.block_pending = None
+
+    # number of outputs of process_block() for a block of num_samples samples
+    def get_num_block_outputs(self, num_samples):
+        first_out = (self.N - 1) + (self.R - 2) % self.R - self.delay
+        return max((num_samples - 1 - self.delay - first_out) // self.R + 1, 0)
+
+    # like process_block(), but the filter state and the decimation phase are kept between calls,
+    # so a stream can be processed in chunks of any size with the same result as one large block
+    def push(self, samples):
+        samples = np.asarray(samples)
+        if self.layout == "sample_major":
+            samples = np.moveaxis(samples, 0, -1)
+        # the block functions work on the last axis, the other axes are channels
+        start = self.block_samples
+        self.block_samples += samples.shape[-1]
+        # index of the input sample that the first output belongs to
+        first_out = (self.N - 1) + (self.R - 2) % self.R - self.delay
+        # the combs need all earlier samples on the decimation grid, not only the ones that are output
+        grid = np.arange((first_out - start) % self.R, samples.shape[-1], self.R)
+        data = self.block_outputs(samples, grid)
+        data = data[..., max(first_out - start - grid[0], 0) // self.R:] if len(grid) > 0 else data
+
+        # the newest self.delay samples have not reached the output yet, keep their outputs for the next call
+        if self.block_pending is not None:
+            data = np.concatenate((self.block_pending, data), axis=-1)
+        num_out = self.get_num_block_outputs(self.block_samples)
+        num_pending = max((self.block_samples - 1 - first_out) // self.R + 1, 0) - num_out
+        self.block_pending = data[..., data.shape[-1] - num_pending:]
+        data = data[..., :data.shape[-1] - num_pending]
+        if self.layout == "sample_major":
+            return np.ascontiguousarray(np.moveaxis(data, -1, 0))
+        return data
+
+    # scaled outputs of the last stage at the grid indices, the block state is updated
+    def block_outputs(self, samples, grid):
+        if self.engine == "pruned":
+            return self.pruned_block(samples, grid)
+        elif self.engine == "polyphase":
+            return self.scale_block(self.fir_block(samples.astype(self.dtype), grid))
+        return self.scale_block(self.cumsum_block(samples.astype(self.dtype), grid))
+
+    # cycle accurate version of process_block() for an AXI stream with gaps, data and valid have one entry
+    # per clock (like s_axis_in_tdata and s_axis_in_tvalid), the result is the same as calling set_data()
+    # for every valid cycle and tick() for every cycle of a freshly reset model
+    # returns the clock indices where data_valid() is true (m_axis_out_tvalid) and the output data
+    # like in downsampler.sv the decimation counter counts valid inputs: it fires on the valid inputs
+    # first_out, first_out + R, ... of the block grid and the output of that input appears
+    # extra_delay + extra_delay_2 - 2 clocks after it, also if no further input follows
+    # the block state is reset, the taps engine is not supported because it propagates its stages also
+    # in clocks without valid input
+    def process_cycles(self, data, valid):
+        assert self.engine != "taps", "the taps engine is not supported"
+        data = np.asarray(data)
+        valid_cycles = np.flatnonzero(valid)
+        first_out = (self.N - 1) + (self.R - 2) % self.R - self.delay
+        # index (counted in valid inputs) of the inputs where the decimation counter fires
+        events = np.arange(first_out, len(valid_cycles), self.R)
+        cycles = valid_cycles[events] + self.extra_delay + self.extra_delay_2 - 2
+        events = events[cycles < len(valid)]
+        cycles = cycles[cycles < len(valid)]
+        if len(events) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        # the combs need all earlier inputs on the decimation grid
+        self.reset_block()
+        grid = np.arange(first_out % self.R, events[-1] + 1, self.R)
+        values = self.block_outputs(data[valid_cycles[:events[-1] + 1]], grid)
+        self.reset_block()
+        return cycles, values[first_out // self.R:]
+
+    # decimates samples with rate changes like VAR_RATE = 1, schedule is a list of (sample index, rate), the rate
+    # applies from that sample on (the samples before the first entry use the current rate)
+    # like s_axis_rate_tvalid in the hdl every rate change resets the integrators, the combs and the decimation
+    # counter and selects the scaling of the new rate, so every segment is decimated like process_block()
+    # after set_rate(), but only the rate dependent parameters are updated between the segments
+    # returns the concatenated outputs and the index of the first output of every segment,
+    # the model is left at the last rate with a reset state
+    def process_schedule(self, samples, schedule):
+        assert self.VAR_RATE, "rate changes need VAR_RATE = 1"
+        samples = np.asarray(samples)
+        axis = 0 if self.layout == "sample_major" else -1
+        schedule = [(int(index), int(rate)) for index, rate in schedule]
+        if len(schedule) == 0 or schedule[0][0] > 0:
+            schedule = [(0, self.R)] + schedule
+        starts = [index for index, rate in schedule]
+        assert starts == sorted(starts) and starts[-1] <= samples.shape[axis], "the schedule has to be sorted by sample index"
+        assert all(1 <= rate <= self.CIC_R for index, rate in schedule), f"the rates have to be in 1..{self.CIC_R}"
+        if self.engine == "pruned":
+            # the LUT of cic_d.sv, calculated once for all rates
+            shift_numbers, mult_numbers = load_tool("calculate_scaling_lut").calculate_scaling_lut(self.CIC_R, self.N, self.M, self.NUM_SHIFT)
+        fir_coefficients = {}
+        outputs = []
+        for (start, rate), end in zip(schedule, starts[1:] + [samples.shape[axis]]):
+            self.R = rate
+            self.set_gain()
+            if self.engine == "pruned":
+                self.set_scaling(int(shift_numbers[rate]), int(mult_numbers[rate]))
+            elif self.engine == "polyphase":
+                if rate not in fir_coefficients:
+                    fir_coefficients[rate] = self.get_fir_coefficients()
+                self.fir_coefficients = fir_coefficients[rate]
+            outputs.append(self.process_block(samples[start:end] if axis == 0 else samples[..., start:end]))
+        offsets = np.cumsum([0] + [output.shape[axis] for output in outputs[:-1]])
+        self.set_rate(self.R)
+        return np.concatenate(outputs, axis=axis), offsets
+
+    # generator that decimates an iterable of chunks with push()
+    def stream(self, chunks):
+        for chunk in chunks:
+            yield self.push(chunk)
+
+    # like process_block(), but the block is split into num_segments time segments that are decimated
+    # in a process pool, every segment is pre-rolled with the N*R*M samples before it (the memory of the filter)
+    # and starts on the decimation grid, so the concatenated output is identical to process_block()
+    # the samples are copied once into shared memory and the workers only get the index range of their segment
+    # the pruned engine is not supported, the truncation in its integrators depends on the whole history
+    # the workers import this file by its path, see load_worker_module(), the caller does not need to register it
+    def process_parallel(self, samples, num_segments=None, max_workers=None):
+        assert self.engine != "pruned", "the pruned engine cannot be split into independent segments"
+        samples = np.asarray(samples)
+        assert samples.dtype != object, "the samples have to fit into an integer dtype of numpy"
+        time_axis = 0 if self.layout == "sample_major" else -1
+        num_samples = samples.shape[time_axis]
+        if num_segments is None:
+            num_segments = max_workers if max_workers is not None else os.cpu_count()
+        first_out = (self.N - 1) + (self.R - 2) % self.R - self.delay
+        preroll = self.N * self.R * self.M
+        # segment boundaries are multiples of R, so the pre-rolled segments start on the decimation grid
+        bounds = [int(i * num_samples / num_segments) // self.R * self.R for i in np.arange(num_segments)] + [num_samples]
+        segments = []
+        for seg_start, seg_end in zip(bounds[:-1], bounds[1:]):
+            if seg_end <= seg_start:
+                continue
+            start = max(seg_start - preroll, 0)
+            # the outputs of the last self.delay samples of a segment need some samples of the next one
+            end = seg_end if seg_end == num_samples else min(seg_end + self.delay, num_samples)
+            # the segment keeps the outputs on the samples seg_start ... seg_end-1
+            first = max(-((first_out + start - seg_start) // self.R), 0)
+            last = -((first_out + start - seg_end) // self.R)
+            segments.append((start, end, first, last))
+        if len(segments) == 0:
+            return self.process_block(samples)
+
+        worker = load_worker_module()
+        shm = shared_memory.SharedMemory(create=True, size=max(samples.nbytes, 1))
+        try:
+            np.ndarray(samples.shape, dtype=samples.dtype, buffer=shm.buf)[...] = samples
+            outputs = []
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=worker.init_parallel_worker,
+                                                        initargs=(self.__getstate__(), shm.name, samples.shape, samples.dtype)) as executor:
+                futures = [(executor.submit(worker.parallel_block, start, end, time_axis), first, last) for start, end, first, last in segments]
+                for future, first, last in futures:
+                    index = [slice(None)] * samples.ndim
+                    index[time_axis] = slice(first, last)
+                    outputs.append(future.result()[tuple(index)])
+        finally:
+            shm.close()
+            shm.unlink()
+        return np.concatenate(outputs, axis=time_axis)
+
+    # decimates a raw capture file with interleaved channels (sample 0 of all channels, sample 1 ...) into a
+    # raw output file with the same layout, both files are memory mapped and processed in chunks of chunk_size
+    # samples, so the memory usage does not depend on the file size
+    # after every chunk the state of push() is saved to output_path + ".progress", an interrupted run
+    # (or one that was stopped after max_chunks chunks) continues from there when it is called again,
+    # the progress file is removed when the whole file is processed
+    # returns the number of output samples per channel
+    def process_file(self, input_path, output_path, dtype="<i2", num_channels=1, output_dtype=None, chunk_size=2**20, max_chunks=None):
+        if output_dtype is None:
+            output_dtype = "<i4" if self.OUT_DW <= 32 else "<i8"
+        inp = np.memmap(input_path, dtype=dtype, mode="r")
+        inp = inp.reshape(-1, num_channels) if num_channels > 1 else inp
+        num_samples = inp.shape[0]
+        num_out = self.get_num_block_outputs(num_samples)
+        out_shape = (num_out, num_channels) if num_channels > 1 else (num_out,)
+        # everything that has to be the same to continue an interrupted run
+        key = (self.R, self.N, self.M, self.INP_DW, self.OUT_DW, self.EXACT_SCALING, self.engine, num_samples,
+               num_channels, np.dtype(dtype).str, np.dtype(output_dtype).str, getattr(self, "exact_scaling_factor", None))
+
+        progress_path = output_path + ".progress"
+        if os.path.exists(progress_path):
+            with open(progress_path, "rb") as f:
+                progress = pickle.load(f)
+            assert progress["key"] == key, f"{progress_path} belongs to a different run"
+            for name, value in progress["state"].items():
+                setattr(self, name, value)
+            num_written = progress["num_written"]
+            out = np.memmap(output_path, dtype=output_dtype, mode="r+", shape=out_shape)
+        else:
+            self.reset_block()
+            num_written = 0
+            out = np.memmap(output_path, dtype=output_dtype, mode="w+", shape=out_shape)
+
+        num_chunks = 0
+        while self.block_samples < num_samples and (max_chunks is None or num_chunks < max_chunks):
+            chunk = np.asarray(inp[self.block_samples:self.block_samples + chunk_size])
+            # the file is sample major, push() expects the layout of the model
+            data = self.push(chunk if self.layout == "sample_major" or num_channels == 1 else chunk.T)
+            data = data if self.layout == "sample_major" or num_channels == 1 else data.T
+            out[num_written:num_written + len(data)] = data
+            num_written += len(data)
+            num_chunks += 1
+            # the output has to be on disk before the progress says so
+            out.flush()
+            state = {name: getattr(self, name) for name in ("block_samples", "block_integrators", "block_combs", "block_history", "block_pending")}
+            with open(progress_path + ".tmp", "wb") as f:
+                pickle.dump({"key": key, "state": state, "num_written": num_written}, f)
+            os.replace(progress_path + ".tmp", progress_path)
+        del out
+        if self.block_samples >= num_samples and os.path.exists(progress_path):
+            os.remove(progress_path)
+        return num_written
+
+    def cumsum_block(self, data, grid):
+        channels = data.shape[:-1]
+        if self.block_integrators is None:
+            self.block_integrators = np.zeros((self.N,) + channels, dtype=self.dtype)
+            self.block_combs = np.zeros((self.N,) + channels + (self.M,), dtype=self.dtype)
+        for i_s in np.arange(self.N):
+            data = np.cumsum(data, axis=-1) + self.block_integrators[i_s, ..., np.newaxis]
+            if data.shape[-1] > 0:
+                self.block_integrators[i_s] = data[..., -1]
+        data = data[..., grid]
+        for i_s in np.arange(self.N):
+            data = np.concatenate((self.block_combs[i_s], data), axis=-1)
+            self.block_combs[i_s] = data[..., data.shape[-1] - self.M:]
+            data = data[..., self.M:] - data[..., :-self.M]
+        return data
+
+    # vectorized version of tick_pruned, int64 if the registers are at most 63 bits wide, multiple
+    # 32-bit digits per value otherwise
+    def pruned_block(self, samples, grid):
+        B = self.prune_bits
+        channels = np.shape(samples)[:-1]
+        if self.block_integrators is None:
+            self.block_integrators = [WideArray.from_int(np.zeros(channels + (1,)), self.B_max_hdl - min(B[i_s], B[i_s + 1])) for i_s in np.arange(self.N)]
+            self.block_combs = [WideArray.from_int(np.zeros(channels + (self.M,)), self.B_max_hdl - B[self.N + j]) for j in np.arange(self.N)]
+        data = WideArray.from_int(samples, self.B_max_hdl - B[0])
+        if self.VAR_RATE:
+            data = data.shl(self.pre_shift)
+        for i_s in np.arange(self.N):
+            idw = self.B_max_hdl - B[i_s]
+            odw = self.B_max_hdl - B[i_s + 1]
+            data = WideArray.concatenate((self.block_integrators[i_s], data.resize(max(idw, odw)))).cumsum()
+            self.block_integrators[i_s] = data[len(data) - 1:]
+            data = data[1:].shr(max(idw - odw, 0))
+        data = data[grid]
+        for j in np.arange(self.N):
+            idw = self.B_max_hdl - B[self.N + j]
+            odw = self.B_max_hdl - B[self.N + j + 1]
+            data = WideArray.concatenate((self.block_combs[j], data))
+            self.block_combs[j] = data[len(data) - self.M:]
+            data = (data[self.M:] - data[:len(data) - self.M]).shr(max(idw - odw, 0)).resize(odw)
+
+        dw_out = self.B_max_hdl - B[2*self.N]
+        if self.EXACT_SCALING:
+            data = data.resize(dw_out + max(self.exact_scaling_factor.bit_length(), self.NUM_SHIFT) + 1)
+            data = data.mul(self.exact_scaling_factor).shr(self.NUM_SHIFT + dw_out - self.OUT_DW)
+        else:
+            data = data.shr(max(dw_out - self.OUT_DW, 0))
+        return data.resize(self.OUT_DW).to_int()
+
+    # evaluates the equivalent FIR filter only at the given sample indices
+    def fir_block(self, data, indices):
+        coefficients = self.fir_coefficients[::-1]
+        if self.block_history is None:
+            self.block_history = np.zeros(data.shape[:-1] + (len(coefficients) - 1,), dtype=self.dtype)
+        padded = np.concatenate((self.block_history, data), axis=-1)
+        self.block_history = padded[..., padded.shape[-1] - (len(coefficients) - 1):]
+        ret = np.zeros(data.shape[:-1] + (len(indices),), dtype=self.dtype)
+        if len(indices) == 0:
+            return ret
+        windows = sliding_window_view(padded, len(coefficients), axis=-1)
+        # limit the number of windows that are copied at once
+        chunk_size = max(1, 2**22 // (len(coefficients) * max(math.prod(data.shape[:-1]), 1)))
+        for i in np.arange(0, len(indices), chunk_size):
+            ret[..., i:i + chunk_size] = windows[..., indices[i:i + chunk_size], :] @ coefficients
+        return ret
+
+    def scale_block(self, data):
+        if self.EXACT_SCALING:
+            if self.B_max <= 53:
+                # values and gain are exact in float64, so the division rounds like the int division of get_scaled_data()
+                data = np.trunc(data.astype(np.float64) / self.CIC_Filter_Gain)
+            else:
+                # float64 would round the values before the division, the quotients fit into INP_DW bits
+                data = np.array([int(int(value) / self.CIC_Filter_Gain) for value in data.ravel()], dtype=np.float64).reshape(data.shape)
+            data = data * (2**(self.OUT_DW-self.INP_DW))
+            return data if self.OUT_DW < self.INP_DW else data.astype(np.int64)
+        else:
+            num_shift = self.Num_Output_Bits_Without_Truncation - self.OUT_DW
+            if num_shift < 0:
+                num_shift = 0
+            return (data >> int(num_shift)).astype(np.int64)
+
+    def get_cic_out(self):
+        if self.engine != "taps":
+            return self.cic_out
+        return self.cic_model_stage_get_out(self.N - 1)
+
     def get_scaled_data(self):
+        if self.engine == "pruned":
+            # the pruned engine already scales like the hdl
+            return self.cic_out
         if self.EXACT_SCALING:
-            return int(self.cic_model_stage_get_out(self.N - 1) / self.CIC_Filter_Gain)*(2**(self.OUT_DW-self.INP_DW));
-            #return int(self.cic_model_stage_get_out(self.N - 1)) >> int(self.Num_Output_Bits_Without_Truncation - self.OUT_DW)
+            return int(self.get_cic_out() / self.CIC_Filter_Gain)*(2**(self.OUT_DW-self.INP_DW));
+            #return int(self.get_cic_out()) >> int(self.Num_Output_Bits_Without_Truncation - self.OUT_DW)
         else:
             num_shift = self.Num_Output_Bits_Without_Truncation - self.OUT_DW
             if num_shift < 0:
                 num_shift = 0
-            return int(self.cic_model_stage_get_out(self.N - 1)) >> int(num_shift)
+            return int(self.get_cic_out()) >> int(num_shift)
         
@@ -0,0 +1,85 @@
+import os
+import sys
+import importlib.util
+import numpy as np
+
+# the multi-word arithmetic of the decimator model is reused
+model_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), 'cic_d_model.py'))
+spec = importlib.util.spec_from_file_location("cic_d_model", model_dir)
+cic_d_model = sys.modules.get(spec.name)
+if cic_d_model is None:
+    cic_d_model = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = cic_d_model
+    spec.loader.exec_module(cic_d_model)
+WideArray = cic_d_model.WideArray
+
+# $clog2
+def clog2(value):
+    return (int(value) - 1).bit_length() if value > 0 else 0
+
+# bit-true model of the interpolator data path of cic_i.sv
+# dw - input data width
+# r  - interpolation ratio
+# m  - CIC order (comb chain length, integrator chain length)
+# g  - differential delay in combs
+# every input sample is one in_dv of the hdl, it produces r output samples (one per clock),
+# the pipeline delay of the hdl registers is not modelled
+# the combs run at the input rate and the integrators at the output rate, the zero-stuffed input of
+# the first integrator is never built: its output is the cumulative sum of the combs held for r clocks
+# every register wraps around at the width that cic_i.sv declares for it
+# the input can have leading channel axes, the samples are on the last axis
+class Model:
+    def __init__(self, dw, r, m, g=1):
+        self.dw = dw
+        self.r = r
+        self.m = m
+        self.g = g
+        # output width of comb stage i, the input of stage 0 is dw bits wide
+        self.comb_widths = [dw + i if i == m - 1 else dw + i + 1 for i in range(m)]
+        # input and output width of integrator stage j
+        self.integrator_inp_widths = [dw + m - 1 if j == 0 else dw + clog2(((2**(m - j)) * (r**j)) // r) for j in range(m)]
+        self.integrator_out_widths = [dw + clog2(((2**(m - j - 1)) * (r**(j + 1))) // r) for j in range(m)]
+        self.out_dw = dw + clog2((r**m) // r)
+        self.reset()
+
+    def reset(self):
+        self.combs = None
+        self.integrators = None
+
+    # interpolates a whole block of samples as if they were clocked into a freshly reset model
+    def process_block(self, samples):
+        self.reset()
+        return self.push(samples)
+
+    # interpolates the next chunk of a stream, the comb delay lines and the integrators are kept
+    # between the calls, so the concatenated outputs are identical to one process_block() call
+    def push(self, samples):
+        samples = np.asarray(samples)
+        channels = samples.shape[:-1]
+        if self.combs is None:
+            self.combs = [WideArray.from_int(np.zeros(channels + (self.g,)), self.dw if i == 0 else self.comb_widths[i - 1]) for i in np.arange(self.m)]
+            self.integrators = [WideArray.from_int(np.zeros(channels + (1,)), max(self.integrator_inp_widths[j], self.integrator_out_widths[j])) for j in np.arange(self.m)]
+        data = WideArray.from_int(samples, self.dw)
+        for i in np.arange(self.m):
+            data = WideArray.concatenate((self.combs[i], data))
+            self.combs[i] = data[len(data) - self.g:]
+            # the comb output register is wider than its input, except for the last stage
+            width = self.comb_widths[i]
+            data = data.resize(max(width, data.width))
+            data = (data[self.g:] - data[:len(data) - self.g]).resize(width)
+        for j in np.arange(self.m):
+            idw = self.integrator_inp_widths[j]
+            odw = self.integrator_out_widths[j]
+            data = WideArray.concatenate((self.integrators[j], data.resize(idw).resize(max(idw, odw)))).cumsum()
+            self.integrators[j] = data[len(data) - 1:]
+            data = data[1:]
+            if j == 0:
+                # the accumulator holds its value while the upsampled input is zero
+                data = WideArray(np.repeat(data.digits, self.r, axis=-1), data.width)
+            # the integrator outputs the upper odw bits of its accumulator
+            data = data.shr(max(idw - odw, 0))
+        return data.resize(self.out_dw).to_int() if self.out_dw <= 63 else data.resize(self.out_dw).to_object()
+
+    def stream(self, chunks):
+        for chunk in chunks:
+            yield self.push(chunk)
@@ -0,0 +1,55 @@
+import math
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# FIR decimator stage that can follow the CIC model, e.g. with the coefficients from
+# tools/design_compensation_fir.py, it works on NumPy arrays like Model.push() of cic_d_model.py
+# coefficients are integers, every output is (sum of coefficients * inputs) >> shift wrapped at OUT_DW bits
+# output k is calculated from the inputs up to input k*D (the first input gives the first output),
+# only these outputs are calculated (polyphase decimation)
+# the input can have leading channel axes, the samples are on the last axis
+class Model:
+    def __init__(self, coefficients, D, INP_DW, OUT_DW, shift=0):
+        self.coefficients = np.asarray(coefficients, dtype=np.int64)
+        self.D = D
+        self.INP_DW = INP_DW
+        self.OUT_DW = OUT_DW
+        self.shift = shift
+        # the accumulator has to hold the sum of all products
+        acc_dw = INP_DW + int(np.max(np.abs(self.coefficients))).bit_length() + 1 + math.ceil(math.log2(len(self.coefficients)))
+        self.dtype = np.int64 if acc_dw <= 63 else object
+        self.reset()
+
+    def reset(self):
+        self.block_samples = 0
+        self.block_history = None
+
+    # decimates a whole block as if it was clocked into a freshly reset filter
+    def process_block(self, samples):
+        self.reset()
+        return self.push(samples)
+
+    # like process_block(), but the filter history and the decimation phase are kept between calls
+    def push(self, samples):
+        samples = np.asarray(samples).astype(self.dtype)
+        coefficients = self.coefficients.astype(self.dtype)[::-1]
+        if self.block_history is None:
+            self.block_history = np.zeros(samples.shape[:-1] + (len(coefficients) - 1,), dtype=self.dtype)
+        grid = np.arange(-self.block_samples % self.D, samples.shape[-1], self.D)
+        self.block_samples += samples.shape[-1]
+        padded = np.concatenate((self.block_history, samples), axis=-1)
+        self.block_history = padded[..., padded.shape[-1] - (len(coefficients) - 1):]
+        ret = np.zeros(samples.shape[:-1] + (len(grid),), dtype=self.dtype)
+        if len(grid) > 0:
+            windows = sliding_window_view(padded, len(coefficients), axis=-1)
+            # limit the number of windows that are copied at once
+            chunk_size = max(1, 2**22 // (len(coefficients) * max(math.prod(samples.shape[:-1]), 1)))
+            for i in np.arange(0, len(grid), chunk_size):
+                ret[..., i:i + chunk_size] = windows[..., grid[i:i + chunk_size], :] @ coefficients
+        ret = ret >> self.shift
+        ret = ((ret + (1 << (self.OUT_DW - 1))) & ((1 << self.OUT_DW) - 1)) - (1 << (self.OUT_DW - 1))
+        return ret.astype(np.int64) if self.OUT_DW <= 63 else ret
+
+    def stream(self, chunks):
+        for chunk in chunks:
+            yield self.push(chunk)
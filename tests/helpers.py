@@ -0,0 +1,26 @@
+import os
+import sys
+import importlib.util
+import numpy as np
+
+# helpers that are shared by the tests of the models and the tools
+
+tests_dir = os.path.abspath(os.path.dirname(__file__))
+
+# loads a file of the repository as module, path is relative to the tests directory
+# register=True adds the module to sys.modules, this is needed if its objects are pickled
+def load(name, path, register=False):
+    spec = importlib.util.spec_from_file_location(name, os.path.abspath(os.path.join(tests_dir, path)))
+    module = importlib.util.module_from_spec(spec)
+    if register:
+        sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def generate_input(num_items, dw, seed=30):
+    rng = np.random.default_rng(seed) # reproducible tests
+    return rng.integers(-2**(dw-1), 2**(dw-1), num_items)
+
+# two's complement wrap around of a python int at width bits
+def wrap_int(value, width):
+    return ((value + (1 << (width - 1))) & ((1 << width) - 1)) - (1 << (width - 1))
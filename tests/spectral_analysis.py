@@ -1,6 +1,5 @@
 import cocotb
 from cocotb.clock import Clock
-from cocotb.triggers import Timer
 from cocotb.triggers import RisingEdge, ReadOnly
 from fixedpoint import FixedPoint
 from collections import deque
@@ -18,45 +17,11 @@ from scipy import signal
 
 
 import importlib.util
+# the spectral estimates do not need cocotb, they are tested in test_spectral_estimation.py
+from spectral_estimation import dB20, dB10, PSD, WelchPSD, stream_spectra
 
 CLK_PERIOD_S = (1/500E6)  # 500 MHz
 
-def dB20(array):
-    with np.errstate(divide='ignore'):
-        return 20 * np.log10(array)
-        
-def dB10(array):
-    with np.errstate(divide='ignore'):
-        return 10 * np.log10(array)    
-        
-def PSD(s,window='boxcar',fs=1,scaling='psd',sides='one'):
-    w = signal.get_window(window,len(s))
-    s *= w
-    s /= sum(w)/len(s)
-    S = np.fft.fftshift(np.fft.fft(s))
-    freq = np.fft.fftshift(np.fft.fftfreq(n=len(s), d=1/fs))
-    if sides == 'one':
-        S_onesided = np.zeros(int(np.floor((len(s)/2)) + len(s)%2)).astype(np.complex64)
-        freq_onesided = np.zeros(len(S_onesided))
-        if len(s) % 2 == 0:
-            S_onesided = S[int(len(S)/2):] * 2
-            freq_onesided = freq[int(len(S)/2):]
-        else:
-            S_onesided[0] = S[int((len(S) - 1)/2)]
-            S_onesided = S[int((len(S) - 1)/2) + 1:] * 2
-            freq_onesided = freq[int((len(S)-1)/2) + 1:]            
-        S = S_onesided
-        freq = freq_onesided
-    PS = (np.abs(S)/len(s))**2
-    if scaling == 'ps':  # units V^2
-        S = PS
-    elif scaling == 'psd':  # unit V^2/Hz
-        df = fs/N
-        S *= PS/df
-    else:
-        assert False, "unknown scaling " + scaling
-    return (S, freq)
-
 class TB(object):
     def __init__(self,dut):
         random.seed(30) # reproducible tests
@@ -88,15 +53,10 @@ class TB(object):
         spec.loader.exec_module(foo)
         self.model = foo.Model(self.R, self.N, self.M, self.INP_DW, self.OUT_DW, self.VAR_RATE, self.EXACT_SCALING) 
         cocotb.fork(Clock(self.dut.clk, CLK_PERIOD_S * 1E9, units='ns').start())
-        cocotb.fork(self.model_clk(CLK_PERIOD_S * 1E9, 'ns'))            
-        
-    async def model_clk(self, period, period_units):
-        timer = Timer(period, period_units)
-        while True:
-            self.model.tick()
-            await timer
 
-    async def generate_input(self, num_items):
+    # the stimulus is generated up front and the expected output is calculated with one
+    # model.process_block() call, the simulation only drives the dut and collects its output
+    def generate_input(self, num_items):
         phase = 0
         if True:
             freq = self.f_mhz*1E6 / CLK_PERIOD_S / self.f_clk
@@ -115,13 +75,16 @@ class TB(object):
             t = np.arange(0, num_items)
             freq = self.f_mhz*1E6 / self.f_clk
             values = np.round(signal.chirp(t=t, f0 = freq/1.1 , f1 = freq, t1 = t[-1])*(2**(self.INP_DW-1)-1))
-        self.input = []
-        for value in values:
+        self.input = values.astype(np.int64)
+        return self.model.process_block(self.input)
+
+    async def drive_input(self):
+        for value in self.input:
             await RisingEdge(self.dut.clk)
-            self.model.set_data(int(value)) 
-            self.input.append(int(value))
             self.dut.s_axis_in_tdata <= int(value)
             self.dut.s_axis_in_tvalid <= 1
+        await RisingEdge(self.dut.clk)
+        self.dut.s_axis_in_tvalid <= 0
 
     async def cycle_reset(self):
         self.dut.s_axis_rate_tvalid <= 0
@@ -194,8 +157,8 @@ async def programmable_scaling_test(dut):
         await tb.programm_scaling_parameters()
         num_items = int(1E4)
         output = []
-        output_model = []
-        gen = cocotb.fork(tb.generate_input(num_items * rate + 1000))
+        output_model = tb.generate_input(num_items * rate + 1000)[:num_items]
+        gen = cocotb.fork(tb.drive_input())
         tolerance = 1
         if tb.EXACT_SCALING:
             # exact scaling needs a bit more tolerance because of rounding errors
@@ -203,12 +166,8 @@ async def programmable_scaling_test(dut):
         count = 0;
         max_count = num_items * rate * 2;
         max_out_value = (2**(tb.OUT_DW-1)-1)
-        while len(output_model) < num_items or len(output) < num_items:
+        while len(output) < num_items:
             await RisingEdge(dut.clk)
-            if(tb.model.data_valid()):
-                output_model.append(tb.model.get_data())
-                #print(f"model:\t[{len(output_model)}]\t {int(output_model[-1])} \t {output_model[-1]/max_out_value}")
-
             if dut.m_axis_out_tvalid == 1:
                 a=dut.m_axis_out_tdata.value.integer
                 if (a & (1 << (tb.OUT_DW - 1))) != 0:
@@ -221,6 +180,20 @@ async def programmable_scaling_test(dut):
                 assert False, "not enough items received"        
         gen.kill()
         tb.dut.s_axis_in_tvalid <= 0
+
+        # Welch spectra of the dut output and of the model streamed in chunks, the strongest tone has to be in
+        # the same bin and the total power has to match
+        nperseg = 1024
+        tb.model.reset_block()
+        _, (psd_model, freq) = stream_spectra(tb.model, np.array_split(tb.input, 16), nperseg, fs=tb.f_clk, scaling='ps',
+                                              input_scale=2**(tb.INP_DW-1)-1, output_scale=max_out_value)
+        psd_hdl = WelchPSD(nperseg, fs=tb.f_clk/tb.R, scaling='ps')
+        psd_hdl.push(np.array(output) / max_out_value)
+        psd_hdl, _ = psd_hdl.result()
+        print(f"tone at {freq[np.argmax(psd_hdl)]*1E-6:.3f} MHz, hdl {dB10(np.sum(psd_hdl)):.3f} dB, model {dB10(np.sum(psd_model)):.3f} dB")
+        assert np.argmax(psd_hdl) == np.argmax(psd_model)
+        assert np.abs(dB10(np.sum(psd_hdl)) - dB10(np.sum(psd_model))) < 0.1
+
         if True:
             fig1 = plt.figure()
             plt.title(F"CIC output\nf_clk = {tb.f_clk*1E-6} MHz, f_signal = {tb.f_mhz} Mhz, n = {num_items}")
@@ -0,0 +1,80 @@
+import numpy as np
+from scipy import signal
+
+def dB20(array):
+    with np.errstate(divide='ignore'):
+        return 20 * np.log10(array)
+        
+def dB10(array):
+    with np.errstate(divide='ignore'):
+        return 10 * np.log10(array)    
+        
+def PSD(s,window='boxcar',fs=1,scaling='psd',sides='one'):
+    w = signal.get_window(window,len(s))
+    s = s * w
+    s /= sum(w)/len(s)
+    if sides == 'one':
+        # dc and nyquist are not mirrored, the amplitude of all other bins is doubled
+        S = np.fft.rfft(s)
+        S[1:(len(s) + 1) // 2] *= 2
+        freq = np.fft.rfftfreq(n=len(s), d=1/fs)
+    else:
+        S = np.fft.fftshift(np.fft.fft(s))
+        freq = np.fft.fftshift(np.fft.fftfreq(n=len(s), d=1/fs))
+    PS = (np.abs(S)/len(s))**2
+    if scaling == 'ps':  # units V^2
+        S = PS
+    elif scaling == 'psd':  # unit V^2/Hz
+        df = fs/len(s)
+        S = PS/df
+    else:
+        assert False, "unknown scaling " + scaling
+    return (S, freq)
+
+# Welch estimate that is accumulated chunk by chunk, the memory does not depend on the length of the signal
+# segments of nperseg samples overlap by noverlap samples (default nperseg/2), the power of all segments is
+# averaged, the scaling and the one sided bins are the same as in PSD(sides='one') for a segment
+class WelchPSD(object):
+    def __init__(self, nperseg, window='hann', noverlap=None, fs=1, scaling='psd'):
+        assert scaling in ('ps', 'psd'), "unknown scaling " + scaling
+        self.nperseg = nperseg
+        self.step = nperseg - (nperseg // 2 if noverlap is None else noverlap)
+        assert self.step > 0, f"noverlap has to be smaller than nperseg = {nperseg}"
+        self.fs = fs
+        self.scaling = scaling
+        w = signal.get_window(window, nperseg)
+        self.window = w / (sum(w)/nperseg)
+        self.power = np.zeros(nperseg // 2 + 1)
+        self.num_segments = 0
+        # samples of the next segments that are not complete yet
+        self.buffer = np.zeros(0)
+
+    def push(self, samples):
+        self.buffer = np.concatenate((self.buffer, np.asarray(samples, dtype=np.float64)))
+        num = (len(self.buffer) - self.nperseg) // self.step + 1 if len(self.buffer) >= self.nperseg else 0
+        if num == 0:
+            return
+        segments = np.lib.stride_tricks.sliding_window_view(self.buffer, self.nperseg)[::self.step][:num]
+        self.power += np.sum(np.abs(np.fft.rfft(segments * self.window, axis=-1))**2, axis=0)
+        self.num_segments += num
+        self.buffer = self.buffer[num * self.step:]
+
+    def result(self):
+        assert self.num_segments > 0, f"less than nperseg = {self.nperseg} samples"
+        PS = self.power / self.num_segments / self.nperseg**2
+        # one sided, dc and nyquist are not mirrored
+        PS[1:(self.nperseg + 1) // 2] *= 4
+        freq = np.fft.rfftfreq(self.nperseg, d=1/self.fs)
+        if self.scaling == 'psd':
+            PS = PS / (self.fs/self.nperseg)
+        return (PS, freq)
+
+# streams the input chunks through model.push() and returns the Welch spectra of the input and of the
+# decimated output, the output rate is fs/R
+def stream_spectra(model, chunks, nperseg, window='hann', fs=1, scaling='psd', input_scale=1, output_scale=1):
+    psd_input = WelchPSD(nperseg, window=window, fs=fs, scaling=scaling)
+    psd_output = WelchPSD(nperseg, window=window, fs=fs/model.R, scaling=scaling)
+    for chunk in chunks:
+        psd_input.push(np.asarray(chunk) / input_scale)
+        psd_output.push(model.push(chunk) / output_scale)
+    return psd_input.result(), psd_output.result()
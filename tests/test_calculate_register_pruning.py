@@ -0,0 +1,104 @@
+import os
+import pytest
+import numpy as np
+from helpers import load
+
+# calculate_register_pruning_sweep() sends get_F_j to a process pool, this needs the module in sys.modules
+calculate_register_pruning = load("calculate_register_pruning", "../tools/calculate_register_pruning.py", register=True)
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("CIC_CACHE_DIR", str(tmp_path))
+    calculate_register_pruning.cached_register_pruning.cache_clear()
+    yield tmp_path / "register_pruning"
+    calculate_register_pruning.cached_register_pruning.cache_clear()
+
+def test_no_disk_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv("CIC_CACHE_DIR", raising=False)
+    monkeypatch.setattr(calculate_register_pruning, "DEFAULT_CACHE_DIR", str(tmp_path))
+    calculate_register_pruning.cached_register_pruning.cache_clear()
+    calculate_register_pruning.calculate_register_pruning(10, 3, 1, 16, 16, verbose=False)
+    assert not os.path.exists(tmp_path / "register_pruning")
+    # explicitly enabled
+    calculate_register_pruning.calculate_register_pruning(10, 3, 1, 16, 16, verbose=False, disk_cache=True)
+    assert len(os.listdir(tmp_path / "register_pruning")) == 1
+
+@pytest.mark.parametrize("R", [10, 4095])
+@pytest.mark.parametrize("N", [3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+def test_disk_cache(R, N, M, cache_dir):
+    B_j = calculate_register_pruning.calculate_register_pruning(R, N, M, 16, 16, verbose=False)
+    assert len(os.listdir(cache_dir)) == 1
+    # hit of the in-process cache and of the disk cache
+    assert np.array_equal(calculate_register_pruning.calculate_register_pruning(R, N, M, 16, 16, verbose=False), B_j)
+    calculate_register_pruning.cached_register_pruning.cache_clear()
+    assert np.array_equal(calculate_register_pruning.calculate_register_pruning(R, N, M, 16, 16, verbose=False), B_j)
+    assert len(os.listdir(cache_dir)) == 1
+    uncached = calculate_register_pruning.calculate_register_pruning(R, N, M, 16, 16, verbose=False, disk_cache=False)
+    assert np.array_equal(uncached, B_j)
+
+def test_cache_version(cache_dir, monkeypatch):
+    B_j = calculate_register_pruning.calculate_register_pruning(10, 3, 1, 16, 16, verbose=False)
+    # a file of the current version is used as it is
+    file_name = cache_dir / os.listdir(cache_dir)[0]
+    F_j, B_j_file = np.load(file_name)
+    np.save(file_name, np.stack((F_j, B_j_file + 1)))
+    calculate_register_pruning.cached_register_pruning.cache_clear()
+    assert np.array_equal(calculate_register_pruning.calculate_register_pruning(10, 3, 1, 16, 16, verbose=False), B_j + 1)
+    # a new version does not read the files of the old one
+    monkeypatch.setattr(calculate_register_pruning, "CACHE_VERSION", calculate_register_pruning.CACHE_VERSION + 1)
+    calculate_register_pruning.cached_register_pruning.cache_clear()
+    assert np.array_equal(calculate_register_pruning.calculate_register_pruning(10, 3, 1, 16, 16, verbose=False), B_j)
+    assert len(os.listdir(cache_dir)) == 2
+
+# F_j as calculated by the first version of calculate_register_pruning(), the impulse response of every
+# integrator stage is a sum of binomial coefficients (Hogenauer, 1981, eq. 9b)
+def get_F_j_reference(R, N, M):
+    binom = calculate_register_pruning.binom
+    F_j = np.zeros(2*N + 2)
+    for j in np.arange(2*N,0,-1):
+        h_j = np.zeros((R*M-1)*N + 2*N)
+        if j <= N:
+            for k in np.arange((R*M-1)*N + j - 1):
+                for L in range(int(np.floor(k/(R*M))) + 1):
+                    h_j[k] += (-1)**L*binom(N, L)*binom(N - j + k - R*M*L, k - R*M*L)
+        else:
+            for k in np.arange(2*N + 1 - j + 1):
+                h_j[k] = (-1)**k*binom(2*N + 1 - j, k)
+        F_j[j] = np.sqrt(np.dot(h_j,h_j))
+    F_j[2*N + 1]=1
+    return F_j
+
+@pytest.mark.parametrize("R", [1, 2, 3, 10, 33, 100])
+@pytest.mark.parametrize("N", [1, 2, 3, 4, 5, 6])
+@pytest.mark.parametrize("M", [1, 2])
+def test_get_F_j(R, N, M):
+    F_j = calculate_register_pruning.get_F_j(R, N, M)
+    F_j_reference = get_F_j_reference(R, N, M)
+    assert np.allclose(F_j, F_j_reference, rtol=1e-12, atol=0)
+    for INP_DW, OUT_DW in [(16, 16), (16, 32), (32, 20)]:
+        assert np.array_equal(calculate_register_pruning.get_B_j(F_j, R, N, M, INP_DW, OUT_DW),
+                              calculate_register_pruning.get_B_j(F_j_reference, R, N, M, INP_DW, OUT_DW))
+
+# B_1 .. B_2N+1 of get_F_j_reference(), too slow to be calculated in every test run
+@pytest.mark.parametrize("R, N, M, INP_DW, OUT_DW, B_j", [
+    (4095, 6, 1, 16, 16, [4, 16, 28, 39, 49, 60, 65, 66, 67, 68, 68, 69, 72]),
+    (4096, 4, 2, 32, 32, [5, 18, 30, 41, 47, 48, 49, 50, 52]),
+    (1000, 3, 1, 24, 20, [8, 17, 26, 30, 31, 32, 34]),
+])
+def test_known_B_j(R, N, M, INP_DW, OUT_DW, B_j):
+    assert list(calculate_register_pruning.calculate_register_pruning(R, N, M, INP_DW, OUT_DW, verbose=False)[1:]) == B_j
+
+@pytest.mark.parametrize("max_workers", [1, None])
+@pytest.mark.parametrize("clip_Bj", [True, False])
+def test_sweep(max_workers, clip_Bj):
+    R, N, M, INP_DW, OUT_DW = [2, 64, 4095], [1, 3, 6], [1, 2], [16, 24], [12, 16, 32]
+    table = calculate_register_pruning.calculate_register_pruning_sweep(R, N, M, INP_DW, OUT_DW, clip_Bj=clip_Bj, max_workers=max_workers)
+    assert len(table) == len(R) * len(N) * len(M) * len(INP_DW) * len(OUT_DW)
+    for row in table:
+        R_, N_, M_, INP_DW_, OUT_DW_ = [int(row[name]) for name in ("R", "N", "M", "INP_DW", "OUT_DW")]
+        B_j = calculate_register_pruning.calculate_register_pruning(R_, N_, M_, INP_DW_, OUT_DW_, clip_Bj=clip_Bj, verbose=False)
+        assert row["B_max"] == ((R_ * M_)**N_ - 1).bit_length() + INP_DW_
+        assert np.array_equal(row["B_j"][:2*N_ + 2], B_j)
+        assert np.array_equal(row["bits"][:2*N_ + 2], row["B_max"] - B_j)
+        assert np.all(np.isnan(row["B_j"][2*N_ + 2:]))
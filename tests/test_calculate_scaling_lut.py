@@ -0,0 +1,68 @@
+import pytest
+import numpy as np
+from helpers import load
+
+calculate_scaling_lut = load("calculate_scaling_lut", "../tools/calculate_scaling_lut.py")
+MASK_128 = (1 << 128) - 1
+
+# LUT calculation of cic_d.sv (VAR_RATE = 1, PRG_SCALING = 0) one rate after the other with 128 bit registers
+def hdl_scaling_lut(R, N, M, NUM_SHIFT):
+    SCALING_FACTOR_WIDTH = calculate_scaling_lut.clog2_l(calculate_scaling_lut.clog2_l((R * M)**N)) + 1
+    EXACT_SCALING_FACTOR_WIDTH = SCALING_FACTOR_WIDTH + NUM_SHIFT + 1
+    LUT = [0] * (R + 1)
+    LUT2 = [0] * (R + 1)
+    for r in range(1, R + 1):
+        gain_diff = (((R << (NUM_SHIFT // N)) & MASK_128) // r)**N & MASK_128
+        # flog2_l
+        pre_shift = 0
+        i = gain_diff >> NUM_SHIFT
+        while i > 1:
+            i >>= 1
+            pre_shift += 1
+        LUT[r] = pre_shift & ((1 << SCALING_FACTOR_WIDTH) - 1)
+        LUT2[r] = (gain_diff >> pre_shift) & ((1 << EXACT_SCALING_FACTOR_WIDTH) - 1)
+    return LUT, LUT2
+
+@pytest.mark.parametrize("R", [2, 10, 64, 100, 4095])
+@pytest.mark.parametrize("N", [3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("NUM_SHIFT", [None, 10])
+def test_fixed_point(R, N, M, NUM_SHIFT):
+    shift_number, mult_number = calculate_scaling_lut.calculate_scaling_lut(R, N, M, NUM_SHIFT)
+    LUT, LUT2 = hdl_scaling_lut(R, N, M, 5 * N if NUM_SHIFT is None else NUM_SHIFT)
+    assert list(shift_number[1:]) == LUT[1:]
+    assert [int(x) for x in mult_number[1:]] == LUT2[1:]
+
+@pytest.mark.parametrize("R", [2, 10, 64, 100, 4095])
+@pytest.mark.parametrize("N", [3, 6])
+@pytest.mark.parametrize("NUM_SHIFT", [10, 30])
+def test_float(R, N, NUM_SHIFT):
+    shift_number, mult_number = calculate_scaling_lut.calculate_scaling_lut(R, N, 1, NUM_SHIFT, method="float")
+    for rate in np.arange(1, R + 1):
+        # the calculation of the testbench for PRG_SCALING = 1
+        gain_factor_log2 = N * np.log2(2**np.ceil(np.log2(R)) / rate)
+        assert shift_number[rate] == int(gain_factor_log2)
+        assert mult_number[rate] == int(2**(gain_factor_log2 - int(gain_factor_log2)) * 2**NUM_SHIFT)
+    # pre shift and multiplier scale the gain of every rate to the gain of the next power of two
+    rates = np.arange(1, R + 1)
+    gain = rates.astype(float)**N * 2.0**shift_number[1:] * mult_number[1:].astype(float) / 2**NUM_SHIFT
+    assert np.allclose(gain, 2**(N * np.ceil(np.log2(R))), rtol=2**-NUM_SHIFT * 4, atol=0)
+
+@pytest.mark.parametrize("R", [2, 10, 100, 4095])
+@pytest.mark.parametrize("N", [3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("method", ["fixed_point", "float"])
+def test_write_scaling_lut(R, N, M, method, tmp_path):
+    file_name = tmp_path / "scaling_lut.hex"
+    calculate_scaling_lut.write_scaling_lut(str(file_name), R, N, M, method=method)
+    shift_number, mult_number = calculate_scaling_lut.calculate_scaling_lut(R, N, M, method=method)
+    SCALING_FACTOR_WIDTH, EXACT_SCALING_FACTOR_WIDTH = calculate_scaling_lut.get_scaling_lut_widths(R, N, M, 5 * N)
+    # $readmemh into LUT_FILE [1:CIC_R], then split like cic_d.sv
+    lines = file_name.read_text().split()
+    assert len(lines) == R
+    for rate, line in zip(np.arange(1, R + 1), lines):
+        assert len(line) == (SCALING_FACTOR_WIDTH + EXACT_SCALING_FACTOR_WIDTH + 3) // 4
+        value = int(line, 16)
+        assert value < 2**(SCALING_FACTOR_WIDTH + EXACT_SCALING_FACTOR_WIDTH)
+        assert value & ((1 << SCALING_FACTOR_WIDTH) - 1) == shift_number[rate]
+        assert (value >> SCALING_FACTOR_WIDTH) & ((1 << EXACT_SCALING_FACTOR_WIDTH) - 1) == mult_number[rate]
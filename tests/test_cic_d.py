@@ -6,10 +6,15 @@ import pytest
 import math
 import numpy as np
 import importlib.util
+import glob
+import json
+import fcntl
+import hashlib
+import subprocess
+import time
 
 import cocotb
 from cocotb.clock import Clock
-from cocotb.triggers import Timer
 from cocotb.triggers import RisingEdge
 
 CLK_PERIOD_NS = 8
@@ -43,28 +48,49 @@ class TB(object):
         spec.loader.exec_module(foo)
         self.model = foo.Model(self.R, self.N, self.M, self.INP_DW, self.OUT_DW, self.VAR_RATE, self.EXACT_SCALING) 
         cocotb.fork(Clock(self.dut.clk, CLK_PERIOD_NS, units='ns').start())
-        cocotb.fork(self.model_clk(CLK_PERIOD_NS, 'ns'))
-          
-    async def model_clk(self, period, period_units):
-        timer = Timer(period, period_units)
-        while True:
-            self.model.tick()
-            await timer
-
-    async def generate_input(self):
-        phase = 0
+
+    # the stimulus is generated up front and the expected output is calculated with one
+    # model.process_block() call, the simulation only drives the dut and collects its output
+    def generate_input(self, num_items):
+        # enough samples for num_items outputs, the rest of the pipeline is flushed with some extra samples
+        num_samples = (num_items + self.N + 2) * self.R + self.model.extra_delay_2
         freq = 10000
         phase_step = CLK_PERIOD_S * 2 * freq * math.pi
         print(F"normalized freq = {CLK_PERIOD_S*freq:.12f} Hz")
-        self.input = []
-        while True:
-            phase += phase_step
-            value = int(np.round(math.sin(phase)*(2**(self.INP_DW-1)-1)))
+        phases = np.arange(1, num_samples + 1) * phase_step
+        self.input = np.round(np.sin(phases)*(2**(self.INP_DW-1)-1)).astype(np.int64)
+        output_model = self.model.process_block(self.input)[:num_items]
+        assert len(output_model) == num_items, "stimulus is too short"
+        return output_model
+
+    async def drive_input(self):
+        for value in self.input:
             await RisingEdge(self.dut.clk)
-            self.model.set_data(value)
-            self.input.append(value)
-            self.dut.s_axis_in_tdata = value
+            self.dut.s_axis_in_tdata = int(value)
             self.dut.s_axis_in_tvalid = 1
+        await RisingEdge(self.dut.clk)
+        self.dut.s_axis_in_tvalid = 0
+
+    # drives the stimulus and returns the first num_items outputs of the dut
+    async def collect_output(self, num_items, max_count):
+        gen = cocotb.fork(self.drive_input())
+        output = []
+        count = 0
+        max_out_value = (2**(self.OUT_DW-1)-1)
+        while len(output) < num_items:
+            await RisingEdge(self.dut.clk)
+            if self.dut.m_axis_out_tvalid == 1:
+                a=self.dut.m_axis_out_tdata.value.integer
+                if (a & (1 << (self.OUT_DW - 1))) != 0:
+                    a = a - (1 << self.OUT_DW)
+                output.append(a)
+                print(f"hdl: \t[{len(output)}]\t {int(a)} \t {a/max_out_value} ")
+            count += 1
+            if count > max_count:
+                assert False, "not enough items received"
+        gen.kill()
+        self.dut.s_axis_in_tvalid = 0
+        return output
 
     async def cycle_reset(self):
         self.dut.s_axis_rate_tvalid = 0
@@ -95,19 +121,11 @@ class TB(object):
         # set input shift scaling
         assert (self.NUM_SHIFT <= self.RATE_DW-2), F"RATE_DW = {self.RATE_DW} is too small for NUM_SHIFT = {self.NUM_SHIFT}"
         await RisingEdge(self.dut.clk)
-        shift_number = 0
-        mult_number = 0
-        if True:
-            # exact floating-point calculation
-            gain_factor_log2 = self.N * np.log2( 2**np.ceil(np.log2(self.initial_R)) / self.R )
-            shift_number = int(gain_factor_log2) # rounded down
-            mult_number = int(2**(gain_factor_log2 - shift_number) * 2**self.NUM_SHIFT) 
-        if False:
-            # fixed point calculation, needs more tolerance when testing against the model
-            gain_diff = int(np.floor(self.initial_R << int(self.NUM_SHIFT / self.N)) / self.R) ** self.N;
-            shift_number = int(np.floor(np.log2((gain_diff >> self.NUM_SHIFT))))
-            mult_number = gain_diff >> shift_number
-            
+        # exact floating-point calculation, method="fixed_point" needs more tolerance when testing against the model
+        shift_numbers, mult_numbers = calculate_scaling_lut.calculate_scaling_lut(self.initial_R, self.N, self.M, self.NUM_SHIFT, method="float")
+        shift_number = int(shift_numbers[self.R])
+        mult_number = int(mult_numbers[self.R])
+
         print(F"shift_number = {shift_number}")
         print(F"mult_number = {mult_number}")
         self.dut.s_axis_rate_tdata = (1 << (self.RATE_DW-2)) + (shift_number & (2**(self.RATE_DW-2)-1))
@@ -127,32 +145,14 @@ async def simple_test(dut):
     tb = TB(dut)
     await tb.cycle_reset()
     num_items = 100
-    gen = cocotb.fork(tb.generate_input())
-    output = []
-    output_model = []
+    output_model = tb.generate_input(num_items)
     tolerance = 1
     if tb.EXACT_SCALING:
         # exact scaling needs a bit more tolerance because of rounding errors
         tolerance = 0.005
-    count = 0
     max_count = num_items * tb.R * 2;
     max_out_value = (2**(tb.OUT_DW-1)-1)
-    while len(output_model) < num_items or len(output) < num_items:
-        await RisingEdge(dut.clk)
-        if(tb.model.data_valid()):
-            output_model.append(tb.model.get_data())
-            print(f"model:\t[{len(output_model)}]\t {int(output_model[-1])} \t {output_model[-1]/max_out_value}")
-
-        if dut.m_axis_out_tvalid == 1:
-            a=dut.m_axis_out_tdata.value.integer
-            if (a & (1 << (tb.OUT_DW - 1))) != 0:
-                a = a - (1 << tb.OUT_DW)
-            output.append(a)
-            print(f"hdl: \t[{len(output)}]\t {int(a)} \t {a/max_out_value} ")
-        #print(f"{int(tb.model.data_valid())} {dut.m_axis_out_tvalid}")
-        count += 1
-        if count > max_count:
-            assert False, "not enough items received"
+    output = await tb.collect_output(num_items, max_count)
     
     for i in range(num_items):
         if tb.EXACT_SCALING:
@@ -160,8 +160,6 @@ async def simple_test(dut):
         else:
             assert np.abs(output[i] - output_model[i]) <= tolerance, f"hdl: {output[i]} \t model: {output_model[i]}"
     #print(f"received {len(output)} samples")
-    gen.kill()
-    tb.dut.s_axis_in_tvalid <= 0
     
 @cocotb.test()
 async def variable_rate_test(dut):
@@ -173,35 +171,15 @@ async def variable_rate_test(dut):
         await tb.set_rate(rate)
 
         num_items = 50
-        output = []
-        output_model = []
-        gen = cocotb.fork(tb.generate_input())
+        output_model = tb.generate_input(num_items)
         tolerance = 1
         if tb.EXACT_SCALING:
             # hdl code calculates scaling parameter using fixed point, therefore needs more tolerance
             # it is recommended to use PROGRAMMABLE_SCALING if possible and calculate scaling parameters using floating point
             tolerance = 0.005
-        count = 0
         max_count = num_items * rate * 2
         max_out_value = (2**(tb.OUT_DW-1)-1)
-        while len(output_model) < num_items or len(output) < num_items:
-            await RisingEdge(dut.clk)
-            if(tb.model.data_valid()):
-                output_model.append(tb.model.get_data())
-                print(f"model:\t[{len(output_model)}]\t {int(output_model[-1])} \t {output_model[-1]/max_out_value}")
-
-            if dut.m_axis_out_tvalid == 1:
-                a=dut.m_axis_out_tdata.value.integer
-                if (a & (1 << (tb.OUT_DW - 1))) != 0:
-                    a = a - (1 << tb.OUT_DW)
-                output.append(a)
-                print(f"hdl: \t[{len(output)}]\t {int(a)} \t {a/max_out_value} ")
-            #print(f"{int(tb.model.data_valid())} {dut.m_axis_out_tvalid}")
-            count += 1
-            if count > max_count:
-                assert False, "not enough items received"
-        gen.kill()
-        tb.dut.s_axis_in_tvalid <= 0
+        output = await tb.collect_output(num_items, max_count)
         for i in range(num_items):
             if tb.EXACT_SCALING:
                 assert np.abs(output[i] - output_model[i])/max_out_value <= tolerance, f"hdl: {output[i]} \t model: {output_model[i]}"
@@ -222,34 +200,14 @@ async def programmable_scaling_test(dut):
 
         await tb.programm_scaling_parameters()
         num_items = 10
-        output = []
-        output_model = []
-        gen = cocotb.fork(tb.generate_input())
+        output_model = tb.generate_input(num_items)
         tolerance = 1
         if tb.EXACT_SCALING:
             # exact scaling needs a bit more tolerance because of rounding errors
             tolerance = 0.0005    # 0.0005 is enough if fp is used for calculation of the exact scaling factor   
-        count = 0
         max_count = num_items * rate * 2
         max_out_value = (2**(tb.OUT_DW-1)-1)
-        while len(output_model) < num_items or len(output) < num_items:
-            await RisingEdge(dut.clk)
-            if(tb.model.data_valid()):
-                output_model.append(tb.model.get_data())
-                print(f"model:\t[{len(output_model)}]\t {int(output_model[-1])} \t {output_model[-1]/max_out_value}")
-
-            if dut.m_axis_out_tvalid == 1:
-                a=dut.m_axis_out_tdata.value.integer
-                if (a & (1 << (tb.OUT_DW - 1))) != 0:
-                    a = a - (1 << tb.OUT_DW)
-                output.append(a)
-                print(f"hdl: \t[{len(output)}]\t {int(a)} \t {a/max_out_value} ")
-            #print(f"{int(tb.model.data_valid())} {dut.m_axis_out_tvalid}")
-            count += 1
-            if count > max_count:
-                assert False, "not enough items received"        
-        gen.kill()
-        tb.dut.s_axis_in_tvalid <= 0
+        output = await tb.collect_output(num_items, max_count)
         for i in range(num_items):
             if tb.EXACT_SCALING:
                 assert np.abs(output[i] - output_model[i])/max_out_value <= tolerance, f"hdl: {output[i]} \t model: {output_model[i]}"
@@ -261,12 +219,18 @@ async def programmable_scaling_test(dut):
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', 'hdl'))
 
+# loaded once, the results of calculate_register_pruning() are cached in memory (and on disk if CIC_CACHE_DIR is set)
+tools_dir = os.path.abspath(os.path.join(tests_dir, '../tools/calculate_register_pruning.py'))
+spec = importlib.util.spec_from_file_location("calculate_register_pruning", tools_dir)
+calculate_register_pruning = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(calculate_register_pruning)
+tools_dir = os.path.abspath(os.path.join(tests_dir, '../tools/calculate_scaling_lut.py'))
+spec = importlib.util.spec_from_file_location("calculate_scaling_lut", tools_dir)
+calculate_scaling_lut = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(calculate_scaling_lut)
+
 def calculate_prune_bits(R, N, M, INP_DW, OUT_DW):
-    tools_dir = os.path.abspath(os.path.join(tests_dir, '../tools/calculate_register_pruning.py'))
-    spec = importlib.util.spec_from_file_location("calculate_register_pruning", tools_dir)
-    foo = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(foo)
-    B_j = foo.calculate_register_pruning(R, N, M, INP_DW, OUT_DW)
+    B_j = calculate_register_pruning.calculate_register_pruning(R, N, M, INP_DW, OUT_DW, verbose=False)
     
     ret = 0
     for i in range(1,2*N+2):
@@ -274,16 +238,26 @@ def calculate_prune_bits(R, N, M, INP_DW, OUT_DW):
         ret += int(B_j[i])<<(32*(i))
     return ret
 
-@pytest.mark.parametrize("R", [100, 10])
-@pytest.mark.parametrize("N", [6, 3])
-@pytest.mark.parametrize("M", [1, 3])
-@pytest.mark.parametrize("INP_DW", [16])
-@pytest.mark.parametrize("OUT_DW", [14, 16])
-@pytest.mark.parametrize("RATE_DW", [16])
-@pytest.mark.parametrize("PRECALCULATE_PRUNE_BITS", [0, 1])
-@pytest.mark.parametrize("VAR_RATE", [0])
-@pytest.mark.parametrize("EXACT_SCALING", [0, 1])
-def test_cic_d(request, R, N, M, INP_DW, OUT_DW, RATE_DW, VAR_RATE, EXACT_SCALING, PRECALCULATE_PRUNE_BITS):
+def get_simulator_version(simulator):
+    command = {"icarus": ["iverilog", "-V"], "verilator": ["verilator", "--version"]}.get(simulator)
+    try:
+        return subprocess.run(command, capture_output=True, text=True).stdout.splitlines()[0]
+    except (TypeError, OSError, IndexError):
+        return "unknown"
+
+# compiled simulations are stored in sim_build/<simulator>_<hash>, the hash covers the hdl sources,
+# the parameters and the simulator version, so a build is reused by all tests with the same parameters
+# (the testcase is selected at run time) and by later runs
+def get_sim_build(simulator, parameters, sources):
+    key = hashlib.sha256()
+    for source in sorted(sources):
+        with open(source, "rb") as f:
+            key.update(f.read())
+    key.update(json.dumps(parameters, sort_keys=True).encode())
+    key.update(get_simulator_version(simulator).encode())
+    return os.path.join("sim_build", f"{simulator}_{key.hexdigest()[:16]}")
+
+def run_simulation(parameters, testcase):
     dut = "cic_d"
     module = os.path.splitext(os.path.basename(__file__))[0]
     toplevel = dut
@@ -300,6 +274,55 @@ def test_cic_d(request, R, N, M, INP_DW, OUT_DW, RATE_DW, VAR_RATE, EXACT_SCALIN
         os.path.join(rtl_dir, "cic_functions.vh"),
     ]    
 
+    # SIM=verilator selects verilator like in the cocotb makefiles, icarus is the default
+    simulator = os.getenv("SIM", "icarus")
+    extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
+    sim_build = get_sim_build(simulator, parameters, glob.glob(os.path.join(rtl_dir, "*.sv")) + glob.glob(os.path.join(rtl_dir, "*.vh")))
+    kwargs = dict(
+        python_search=[tests_dir],
+        verilog_sources=verilog_sources,
+        includes=includes,
+        toplevel=toplevel,
+        module=module,
+        parameters=parameters,
+        sim_build=sim_build,
+        extra_env=extra_env,
+    )
+    if simulator == "verilator":
+        kwargs["extra_args"] = [os.path.join(tests_dir, "verilator_waiver.vlt"), "-Wno-fatal"]
+    # only one pytest worker compiles a build, the others wait and reuse it
+    os.makedirs(sim_build, exist_ok=True)
+    wait_start = time.perf_counter()
+    with open(sim_build + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        # the time spent waiting for another worker is recorded separately, it depends on the number of workers
+        start = time.perf_counter()
+        lock_wait = start - wait_start
+        if simulator == "verilator":
+            # cocotb_test always runs verilator before the simulation, so the whole run has to hold the lock
+            cocotb_test.simulator.run(testcase=testcase, **kwargs)
+        else:
+            cocotb_test.simulator.run(compile_only=True, **kwargs)
+        fcntl.flock(lock, fcntl.LOCK_UN)
+    if simulator != "verilator":
+        # every run writes its own results file, so runs can share the build directory
+        cocotb_test.simulator.run(testcase=testcase, **kwargs)
+    # one line per run, tests/timing_report.py compares the simulators
+    with open(os.path.join("sim_build", "timing.jsonl"), "a") as f:
+        f.write(json.dumps({"simulator": simulator, "testcase": testcase, "parameters": parameters,
+                            "seconds": time.perf_counter() - start, "lock_wait_seconds": lock_wait}) + "\n")
+
+
+@pytest.mark.parametrize("R", [100, 10])
+@pytest.mark.parametrize("N", [6, 3])
+@pytest.mark.parametrize("M", [1, 3])
+@pytest.mark.parametrize("INP_DW", [16])
+@pytest.mark.parametrize("OUT_DW", [14, 16])
+@pytest.mark.parametrize("RATE_DW", [16])
+@pytest.mark.parametrize("PRECALCULATE_PRUNE_BITS", [0, 1])
+@pytest.mark.parametrize("VAR_RATE", [0])
+@pytest.mark.parametrize("EXACT_SCALING", [0, 1])
+def test_cic_d(request, R, N, M, INP_DW, OUT_DW, RATE_DW, VAR_RATE, EXACT_SCALING, PRECALCULATE_PRUNE_BITS):
     parameters = {}
 
     parameters['CIC_R'] = R
@@ -313,21 +336,11 @@ def test_cic_d(request, R, N, M, INP_DW, OUT_DW, RATE_DW, VAR_RATE, EXACT_SCALIN
     if PRECALCULATE_PRUNE_BITS:
         parameters['PRUNE_BITS'] = calculate_prune_bits(R, N, M, INP_DW, OUT_DW)
 
-    extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
-    sim_build="sim_build/" + "_".join(("{}={}".format(*i) for i in parameters.items()))
-    cocotb_test.simulator.run(
-        python_search=[tests_dir],
-        verilog_sources=verilog_sources,
-        includes=includes,
-        toplevel=toplevel,
-        module=module,
-        parameters=parameters,
-        sim_build=sim_build,
-        extra_env=extra_env,
-        testcase="simple_test",
-    )
-    
-@pytest.mark.parametrize("R", [4095])    # max rate
+    run_simulation(parameters, "simple_test")
+
+
+# max rate, the smaller one keeps the LUT calculation of cic_d.sv in the simulation
+@pytest.mark.parametrize("R, LUT_FILE", [(4095, 1), (100, 0)])
 @pytest.mark.parametrize("N", [6, 3])
 @pytest.mark.parametrize("M", [1, 2])
 @pytest.mark.parametrize("INP_DW", [32])
@@ -336,23 +349,7 @@ def test_cic_d(request, R, N, M, INP_DW, OUT_DW, RATE_DW, VAR_RATE, EXACT_SCALIN
 @pytest.mark.parametrize("CALC_PRUNING", [1])
 @pytest.mark.parametrize("VAR_RATE", [1])
 @pytest.mark.parametrize("EXACT_SCALING", [1, 0])
-def test_cic_d_variable_rate(request, R, N, M, INP_DW, OUT_DW, RATE_DW, VAR_RATE, EXACT_SCALING, CALC_PRUNING):
-    dut = "cic_d"
-    module = os.path.splitext(os.path.basename(__file__))[0]
-    toplevel = dut
-
-    verilog_sources = [
-        os.path.join(rtl_dir, f"{dut}.sv"),
-        os.path.join(rtl_dir, "comb.sv"),
-        os.path.join(rtl_dir, "integrator.sv"),
-        os.path.join(rtl_dir, "downsampler.sv"),
-        os.path.join(rtl_dir, "downsampler_variable.sv"),
-    ]
-    includes = [
-        os.path.join(rtl_dir, ""),
-        os.path.join(rtl_dir, "cic_functions.vh"),
-    ]    
-
+def test_cic_d_variable_rate(request, R, N, M, INP_DW, OUT_DW, RATE_DW, VAR_RATE, EXACT_SCALING, CALC_PRUNING, LUT_FILE):
     parameters = {}
 
     parameters['CIC_R'] = R
@@ -366,20 +363,15 @@ def test_cic_d_variable_rate(request, R, N, M, INP_DW, OUT_DW, RATE_DW, VAR_RATE
     if CALC_PRUNING:
         parameters['PRUNE_BITS'] = calculate_prune_bits(R, N, M, INP_DW, OUT_DW)
 
-    extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
-    sim_build="sim_build/" + "_".join(("{}={}".format(*i) for i in parameters.items()))
-    cocotb_test.simulator.run(
-        python_search=[tests_dir],
-        verilog_sources=verilog_sources,
-        includes=includes,
-        toplevel=toplevel,
-        module=module,
-        parameters=parameters,
-        sim_build=sim_build,
-        extra_env=extra_env,
-        testcase="variable_rate_test",        
-    )    
-    
+    if LUT_FILE:
+        # the LUT calculation in cic_d.sv makes elaboration slow for large R, load it from a file instead
+        lut_file = os.path.abspath(os.path.join("sim_build", f"scaling_lut_R={R}_N={N}_M={M}.hex"))
+        os.makedirs(os.path.dirname(lut_file), exist_ok=True)
+        calculate_scaling_lut.write_scaling_lut(lut_file, R, N, M)
+        parameters['SCALING_LUT_FILE'] = f'"{lut_file}"'
+    run_simulation(parameters, "variable_rate_test")
+
+
 @pytest.mark.parametrize("R", [4095, 4040])    # max rate
 @pytest.mark.parametrize("N", [3, 5])
 @pytest.mark.parametrize("M", [1])
@@ -391,22 +383,6 @@ def test_cic_d_variable_rate(request, R, N, M, INP_DW, OUT_DW, RATE_DW, VAR_RATE
 @pytest.mark.parametrize("PRG_SCALING", [1])
 @pytest.mark.parametrize("CALC_PRUNING", [1])
 def test_cic_d_programmable_scaling(request, R, N, M, INP_DW, OUT_DW, RATE_DW, VAR_RATE, EXACT_SCALING, PRG_SCALING, CALC_PRUNING):
-    dut = "cic_d"
-    module = os.path.splitext(os.path.basename(__file__))[0]
-    toplevel = dut
-
-    verilog_sources = [
-        os.path.join(rtl_dir, f"{dut}.sv"),
-        os.path.join(rtl_dir, "comb.sv"),
-        os.path.join(rtl_dir, "integrator.sv"),
-        os.path.join(rtl_dir, "downsampler.sv"),
-        os.path.join(rtl_dir, "downsampler_variable.sv"),
-    ]
-    includes = [
-        os.path.join(rtl_dir, ""),
-        os.path.join(rtl_dir, "cic_functions.vh"),
-    ]    
-
     parameters = {}
 
     parameters['CIC_R'] = R
@@ -423,17 +399,4 @@ def test_cic_d_programmable_scaling(request, R, N, M, INP_DW, OUT_DW, RATE_DW, V
     if CALC_PRUNING:
         parameters['PRUNE_BITS'] = calculate_prune_bits(R, N, M, INP_DW, OUT_DW)
 
-    extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
-    sim_build="sim_build/" + "_".join(("{}={}".format(*i) for i in parameters.items()))
-    cocotb_test.simulator.run(
-        python_search=[tests_dir],
-        verilog_sources=verilog_sources,
-        includes=includes,
-        toplevel=toplevel,
-        module=module,
-        parameters=parameters,
-        sim_build=sim_build,
-        extra_env=extra_env,
-        testcase="programmable_scaling_test",   
-    )
-
+    run_simulation(parameters, "programmable_scaling_test")
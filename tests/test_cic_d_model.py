@@ -0,0 +1,452 @@
+import os
+import sys
+import pytest
+import numpy as np
+from helpers import load, generate_input
+
+# Model.process_file() pickles the block state into its progress file, the WideArray state of the
+# pruned engine needs the module in sys.modules
+cic_d_model = load("cic_d_model", "../model/cic_d_model.py", register=True)
+
+def run_model(model, samples):
+    output = []
+    for sample in samples:
+        model.set_data(int(sample))
+        model.tick()
+        if model.data_valid():
+            output.append(model.get_data())
+    return output
+
+@pytest.mark.parametrize("R", [1, 2, 10])
+@pytest.mark.parametrize("N", [1, 3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("INP_DW", [12])
+@pytest.mark.parametrize("OUT_DW", [12, 32])
+@pytest.mark.parametrize("EXACT_SCALING", [0, 1])
+@pytest.mark.parametrize("engine", ["recursive", "polyphase"])
+def test_engine(R, N, M, INP_DW, OUT_DW, EXACT_SCALING, engine):
+    samples = generate_input(20 * R + 30, INP_DW)
+    model = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, EXACT_SCALING)
+    model_engine = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, EXACT_SCALING, engine=engine)
+    output = run_model(model, samples)
+    output_engine = run_model(model_engine, samples)
+    assert len(output) > 0
+    assert output == output_engine
+
+@pytest.mark.parametrize("R", [1, 2, 10])
+@pytest.mark.parametrize("N", [1, 3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("INP_DW", [12])
+@pytest.mark.parametrize("OUT_DW", [10, 32])
+@pytest.mark.parametrize("EXACT_SCALING", [0, 1])
+@pytest.mark.parametrize("engine", ["taps", "polyphase"])
+def test_process_block(R, N, M, INP_DW, OUT_DW, EXACT_SCALING, engine):
+    samples = generate_input(20 * R + 30, INP_DW)
+    model = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, EXACT_SCALING)
+    output_block = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, EXACT_SCALING, engine=engine).process_block(samples)
+    # the output pipeline delays data_valid(), keep clocking to collect all outputs of the block
+    padding = generate_input(model.extra_delay_2 - 1, INP_DW, seed=31)
+    output = run_model(model, np.concatenate((samples, padding)))
+    assert len(output_block) > 0
+    assert list(output_block) == output
+
+@pytest.mark.parametrize("R", [1000, 4095])
+@pytest.mark.parametrize("N", [3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("INP_DW", [32])
+@pytest.mark.parametrize("OUT_DW", [32])
+@pytest.mark.parametrize("EXACT_SCALING", [0, 1])
+@pytest.mark.parametrize("engine", ["recursive", "polyphase"])
+def test_process_block_wide(R, N, M, INP_DW, OUT_DW, EXACT_SCALING, engine):
+    # B_max is larger than 53 bits (float64) for these parameters and larger than 64 bits for most of them
+    samples = generate_input(3 * R, INP_DW)
+    model = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, EXACT_SCALING, engine="recursive")
+    output_block = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, EXACT_SCALING, engine=engine).process_block(samples)
+    padding = generate_input(model.extra_delay_2 - 1, INP_DW, seed=31)
+    output = run_model(model, np.concatenate((samples, padding)))
+    assert len(output_block) > 0
+    assert list(output_block) == output
+
+@pytest.mark.parametrize("R, N", [(1000, 3), (4095, 3), (4095, 6)])
+@pytest.mark.parametrize("OUT_DW", [16, 32, 40])
+def test_exact_scaling_wide(R, N, OUT_DW):
+    model = cic_d_model.Model(R, N, 1, 32, OUT_DW, 0, 1, engine="recursive", verbose=False)
+    # last stage outputs close to multiples of the gain, with more than 53 bits float64 would round them
+    # before the division
+    gain = model.CIC_Filter_Gain
+    rng = np.random.default_rng(30)
+    values = [gain * int(k) + int(d) for k, d in zip(rng.integers(-2**31, 2**31, 1000), rng.integers(-(gain >> 20), gain >> 20, 1000))]
+    expected = []
+    for value in values:
+        model.cic_out = value
+        expected.append(model.get_scaled_data())
+    assert list(model.scale_block(np.array(values, dtype=model.dtype))) == expected
+
+@pytest.mark.parametrize("R", [2, 10, 100])
+@pytest.mark.parametrize("N", [1, 3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("INP_DW", [16])
+@pytest.mark.parametrize("OUT_DW", [14, 24])
+def test_pruned_engine_without_pruning(R, N, M, INP_DW, OUT_DW):
+    # without pruning the hdl data path gives the same result as the model
+    samples = generate_input(5 * R + 30, INP_DW)
+    output = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, 0, engine="recursive").process_block(samples)
+    output_pruned = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, 0, engine="pruned", register_pruning=0).process_block(samples)
+    assert len(output) > 0
+    assert list(output) == list(output_pruned)
+
+@pytest.mark.parametrize("N", [1, 3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("EXACT_SCALING", [0, 1])
+def test_pruned_engine_rate_1(N, M, EXACT_SCALING):
+    samples = generate_input(100, 16)
+    model = cic_d_model.Model(1, N, M, 16, 16, 0, EXACT_SCALING, engine="pruned", verbose=False)
+    if M == 1:
+        # the filter has no bit growth, there is nothing to prune
+        model_unpruned = cic_d_model.Model(1, N, M, 16, 16, 0, EXACT_SCALING, engine="pruned", register_pruning=0, verbose=False)
+        assert model.prune_bits == model_unpruned.prune_bits
+        assert list(model.process_block(samples)) == list(model_unpruned.process_block(samples))
+    output = run_model(model, np.concatenate((samples, generate_input(model.extra_delay_2 - 1, 16, seed=31))))
+    assert len(output) > 0
+    assert output == list(model.process_block(samples))
+
+@pytest.mark.parametrize("R", [10, 100, 4095])   # B_max > 63 for R=4095
+@pytest.mark.parametrize("N", [3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("INP_DW", [16, 32])
+@pytest.mark.parametrize("OUT_DW", [14, 32])
+@pytest.mark.parametrize("VAR_RATE", [0, 1])
+@pytest.mark.parametrize("EXACT_SCALING", [0, 1])
+def test_pruned_engine(R, N, M, INP_DW, OUT_DW, VAR_RATE, EXACT_SCALING):
+    samples = generate_input(3 * R + 30, INP_DW)
+    model = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, VAR_RATE, EXACT_SCALING, engine="pruned")
+    if VAR_RATE:
+        model.set_rate(R // 3)
+    output_block = model.process_block(samples)
+    padding = generate_input(model.extra_delay_2 - 1, INP_DW, seed=31)
+    output = run_model(model, np.concatenate((samples, padding)))
+    assert len(output_block) > 0
+    assert list(output_block) == output
+    if not VAR_RATE:
+        # pruning only adds a small error, the fixed point exact scaling of the hdl is a bit different from the model
+        output_unpruned = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, EXACT_SCALING, engine="recursive").process_block(samples)
+        if EXACT_SCALING:
+            assert np.max(np.abs(output_block - output_unpruned))/(2**(OUT_DW-1)-1) <= 0.0005
+        else:
+            assert np.max(np.abs(output_block - output_unpruned)) <= 2
+
+@pytest.mark.parametrize("R", [2, 10, 4095])
+@pytest.mark.parametrize("N", [3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("INP_DW", [16])
+@pytest.mark.parametrize("OUT_DW", [14, 32])
+@pytest.mark.parametrize("EXACT_SCALING", [0, 1])
+@pytest.mark.parametrize("engine", ["taps", "recursive", "polyphase", "pruned"])
+def test_stream(R, N, M, INP_DW, OUT_DW, EXACT_SCALING, engine):
+    if engine == "taps" and R > 100:
+        pytest.skip("taps engine is too slow for large R")
+    samples = generate_input(3 * R + 30, INP_DW)
+    output_block = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, EXACT_SCALING, engine=engine).process_block(samples)
+    # chunks of random size, including empty chunks and chunks shorter than R
+    rng = np.random.default_rng(32)
+    bounds = np.sort(rng.integers(0, len(samples), 20))
+    chunks = np.split(samples, bounds)
+    model = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, EXACT_SCALING, engine=engine)
+    output_stream = np.concatenate(list(model.stream(chunks)))
+    assert len(output_block) > 0
+    assert list(output_stream) == list(output_block)
+
+@pytest.mark.parametrize("R", [2, 10, 4095])
+@pytest.mark.parametrize("N", [3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("INP_DW", [16])
+@pytest.mark.parametrize("OUT_DW", [14])
+@pytest.mark.parametrize("EXACT_SCALING", [0, 1])
+@pytest.mark.parametrize("engine", ["recursive", "polyphase", "pruned"])
+@pytest.mark.parametrize("layout", ["channel_major", "sample_major"])
+def test_multichannel(R, N, M, INP_DW, OUT_DW, EXACT_SCALING, engine, layout):
+    num_channels = 5
+    samples = np.stack([generate_input(3 * R + 30, INP_DW, seed=30 + i) for i in np.arange(num_channels)])
+    model = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, EXACT_SCALING, engine=engine, layout=layout)
+    if layout == "sample_major":
+        output = model.process_block(np.ascontiguousarray(samples.T)).T
+    else:
+        output = model.process_block(samples)
+    assert output.shape[0] == num_channels
+    for i in np.arange(num_channels):
+        output_channel = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, EXACT_SCALING, engine=engine).process_block(samples[i])
+        assert len(output_channel) > 0
+        assert list(output[i]) == list(output_channel)
+    # the state of every channel is kept between the chunks
+    model.reset_block()
+    if layout == "sample_major":
+        output_stream = np.concatenate(list(model.stream(np.array_split(samples.T, 7))), axis=0).T
+    else:
+        output_stream = np.concatenate(list(model.stream(np.array_split(samples, 7, axis=1))), axis=1)
+    assert np.array_equal(output_stream, output)
+
+@pytest.mark.parametrize("R", [2, 10, 100])
+@pytest.mark.parametrize("N", [1, 3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("INP_DW", [16])
+@pytest.mark.parametrize("OUT_DW", [14])
+@pytest.mark.parametrize("engine", ["taps", "recursive", "polyphase"])
+@pytest.mark.parametrize("num_segments", [1, 3, 8])
+def test_process_parallel(R, N, M, INP_DW, OUT_DW, engine, num_segments):
+    samples = generate_input(20 * R * N + 30, INP_DW)
+    model = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, 0, engine=engine)
+    output = model.process_block(samples)
+    output_parallel = model.process_parallel(samples, num_segments=num_segments, max_workers=2)
+    assert len(output) > 0
+    assert list(output_parallel) == list(output)
+
+@pytest.mark.parametrize("layout", ["channel_major", "sample_major"])
+def test_process_parallel_unregistered(layout, monkeypatch):
+    # loaded with importlib under another name and without an entry in sys.modules
+    monkeypatch.delitem(sys.modules, "cic_d_model", raising=False)
+    model_module = load("model", "../model/cic_d_model.py")
+    samples = np.stack([generate_input(3000, 16, seed=30 + i) for i in np.arange(3)])
+    samples = np.ascontiguousarray(samples.T) if layout == "sample_major" else samples
+    model = model_module.Model(10, 3, 1, 16, 14, 0, 0, engine="recursive", layout=layout, verbose=False)
+    output = model.process_parallel(samples, num_segments=4, max_workers=2)
+    assert np.array_equal(output, model.process_block(samples))
+
+@pytest.mark.parametrize("R", [10, 100])
+@pytest.mark.parametrize("N", [3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("INP_DW", [16])
+@pytest.mark.parametrize("OUT_DW", [14])
+@pytest.mark.parametrize("engine", ["recursive", "polyphase", "pruned"])
+@pytest.mark.parametrize("num_channels", [1, 4])
+def test_process_file(R, N, M, INP_DW, OUT_DW, engine, num_channels, tmp_path):
+    samples = np.stack([generate_input(30 * R + 30, INP_DW, seed=30 + i) for i in np.arange(num_channels)])
+    samples.T.astype("<i2").tofile(tmp_path / "capture.bin")
+    output = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, 0, engine=engine).process_block(samples)
+    # stop after a few chunks and resume with a new model instance
+    for max_chunks in [3, None]:
+        model = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, 0, engine=engine)
+        num_out = model.process_file(str(tmp_path / "capture.bin"), str(tmp_path / "output.bin"), num_channels=num_channels,
+                                     chunk_size=7 * R + 3, max_chunks=max_chunks)
+        assert os.path.exists(tmp_path / "output.bin.progress") == (max_chunks is not None)
+    output_file = np.fromfile(tmp_path / "output.bin", dtype="<i4").reshape(-1, num_channels).T
+    assert num_out == output.shape[-1]
+    assert np.array_equal(output_file, output.reshape(num_channels, -1))
+
+@pytest.mark.parametrize("R", [10])
+@pytest.mark.parametrize("N", [3])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("INP_DW", [16])
+@pytest.mark.parametrize("OUT_DW", [14])
+@pytest.mark.parametrize("engine", ["taps", "recursive", "polyphase", "pruned"])
+def test_profiling(R, N, M, INP_DW, OUT_DW, engine):
+    samples = generate_input(20 * R + 30, INP_DW)
+    model = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, 0, engine=engine, verbose=False)
+    model_profile = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, 0, engine=engine, verbose=False, profile=True)
+    output = run_model(model, samples)
+    assert run_model(model_profile, samples) == output
+    # two ticks without valid input
+    model_profile.tick()
+    model_profile.tick()
+    stats = model_profile.stats()
+    assert stats["ticks"] == len(samples) + 2
+    assert stats["valid_inputs"] == len(samples)
+    assert stats["valid_outputs"] == len(output)
+    assert stats["stages_time"] > 0 and stats["scaling_time"] > 0 and stats["delay_lines_time"] > 0
+    # the model without profiling does not count
+    assert model.stats()["ticks"] == 0
+    model_profile.reset_stats()
+    assert model_profile.stats()["ticks"] == 0
+    model_profile.disable_profiling()
+    model_profile.tick()
+    assert model_profile.stats()["ticks"] == 0
+
+# sparse traffic, the gaps are skipped with advance()
+@pytest.mark.parametrize("R", [2, 10])
+@pytest.mark.parametrize("N", [1, 3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("INP_DW", [16])
+@pytest.mark.parametrize("OUT_DW", [14])
+@pytest.mark.parametrize("engine", ["taps", "recursive", "polyphase", "pruned"])
+def test_advance(R, N, M, INP_DW, OUT_DW, engine):
+    samples = generate_input(10 * R + 30, INP_DW)
+    rng = np.random.default_rng(31)
+    gaps = rng.choice([0, 1, 3, 20, 100 * R + 7], len(samples))
+    model = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, 0, engine=engine, verbose=False, profile=True)
+    model_advance = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, 0, engine=engine, verbose=False, profile=True)
+    output = []
+    output_advance = []
+    # idle cycles before the first input
+    for cycle in np.arange(5):
+        model.tick()
+    assert len(model_advance.advance(5)[0]) == 0
+    cycle = 5
+    for sample, gap in zip(samples, gaps):
+        for clock in np.arange(gap + 1):
+            if clock == 0:
+                model.set_data(int(sample))
+            model.tick()
+            if model.data_valid():
+                output.append((cycle + clock, model.get_data()))
+        model_advance.set_data(int(sample))
+        cycles, data = model_advance.advance(gap + 1)
+        output_advance += [(cycle + c, d) for c, d in zip(cycles, data)]
+        cycle += gap + 1
+    assert output_advance == output
+    assert np.array_equal(model_advance.out_valid_2, model.out_valid_2)
+    assert model_advance.decimation_counter == model.decimation_counter
+    # at most one output for every R valid inputs, nothing is repeated in the gaps
+    first_out = (N - 1) + (R - 2) % R - model.delay
+    assert 0 < len(output) <= (len(samples) - 1 - first_out) // R + 1
+    # the skipped cycles are counted
+    stats = model_advance.stats()
+    assert stats["ticks"] == cycle
+    assert stats["valid_inputs"] == len(samples)
+    assert stats["valid_outputs"] == len(output)
+    for name in ("ticks", "valid_inputs", "valid_outputs"):
+        assert stats[name] == model.stats()[name]
+
+# a burst and a long idle time, the outputs of the last inputs of the burst appear in the idle time
+@pytest.mark.parametrize("R", [1, 2, 10])
+@pytest.mark.parametrize("N", [1, 3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("INP_DW", [16])
+@pytest.mark.parametrize("OUT_DW", [14])
+@pytest.mark.parametrize("engine", ["taps", "recursive", "polyphase", "pruned"])
+def test_advance_tail(R, N, M, INP_DW, OUT_DW, engine):
+    # the burst ends with an input that completes an output
+    samples = generate_input((N - 1) + (R - 2) % R - max(N - 2, 0) + 5 * R + 1, INP_DW)
+    idle = 1000 * R
+    model = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, 0, engine=engine, verbose=False)
+    cycles = []
+    outputs = []
+    for cycle, sample in enumerate(samples):
+        model.set_data(int(sample))
+        model.tick()
+        if model.data_valid():
+            cycles.append(cycle)
+            outputs.append(model.get_data())
+    tail_cycles, tail_outputs = model.advance(idle)
+    cycles += list(tail_cycles + len(samples))
+    outputs += list(tail_outputs)
+    # all outputs of the burst, at the clocks of the hdl (shifted by the shorter pipeline of the model)
+    first_out = (N - 1) + (R - 2) % R - model.delay
+    latency = model.extra_delay + model.extra_delay_2 - 2
+    valid = np.arange(len(samples) + idle) < len(samples)
+    reference_cycles = hdl_valid_reference(R, N, valid, counter=R - 1 - first_out) - (2 * N + 2 - latency)
+    reference_outputs = model.process_block(np.concatenate((samples, np.zeros(model.delay, dtype=samples.dtype))))
+    assert len(tail_cycles) > 0
+    assert cycles == list(reference_cycles)
+    # the taps engine keeps propagating its stages in the idle clocks, so only its timing is the one of the hdl
+    if engine != "taps":
+        assert outputs == list(reference_outputs)
+    # nothing is left in the pipeline
+    assert len(model.advance(idle)[0]) == 0
+
+# port of the valid strobes of cic_d.sv with VAR_RATE = 0 and EXACT_SCALING = 0, the integrator stages, the
+# downsampler, the comb stages and the OUT_PIPELINE_STAGES output registers register them on every clock,
+# the counter of downsampler.sv only changes with a valid strobe
+# returns the clocks in which m_axis_out_tvalid is set
+def hdl_valid_reference(R, N, valid, counter=0):
+    integrators = [0] * N
+    downsampler = 0
+    combs = [0] * N
+    out_valid_buf = [0] * 2
+    out_valid = np.zeros(len(valid), dtype=bool)
+    for cycle in np.arange(len(valid)):
+        # all registers take the values of the previous clock
+        out_valid_buf = [combs[-1]] + out_valid_buf[:-1]
+        combs = [downsampler] + combs[:-1]
+        downsampler = integrators[-1] and counter == R - 1
+        if integrators[-1]:
+            counter = counter + 1 if counter < R - 1 else 0
+        integrators = [valid[cycle]] + integrators[:-1]
+        out_valid[cycle] = out_valid_buf[-1]
+    return np.flatnonzero(out_valid)
+
+@pytest.mark.parametrize("R", [1, 2, 10])
+@pytest.mark.parametrize("N", [1, 3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("INP_DW", [16])
+@pytest.mark.parametrize("OUT_DW", [14])
+@pytest.mark.parametrize("EXACT_SCALING", [0, 1])
+@pytest.mark.parametrize("engine", ["recursive", "polyphase", "pruned"])
+@pytest.mark.parametrize("pattern", ["continuous", "bursts", "sparse", "burst_idle"])
+def test_process_cycles(R, N, M, INP_DW, OUT_DW, EXACT_SCALING, engine, pattern):
+    num_cycles = 30 * R + 60
+    data = generate_input(num_cycles, INP_DW)
+    rng = np.random.default_rng(31)
+    if pattern == "continuous":
+        valid = np.ones(num_cycles, dtype=bool)
+        valid[:3] = False
+    elif pattern == "bursts":
+        valid = (np.arange(num_cycles) // 7) % 3 != 2
+    elif pattern == "sparse":
+        valid = rng.random(num_cycles) < 0.2
+    else:
+        # one burst and a long idle time
+        valid = np.arange(num_cycles) < 5 * R + 20
+    model = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, EXACT_SCALING, engine=engine, verbose=False)
+    cycles, outputs = model.process_cycles(data, valid)
+    # same type as process_block(), exact scaling with OUT_DW < INP_DW has fractional outputs
+    assert outputs.dtype == model.process_block(data[valid]).dtype
+    assert np.issubdtype(outputs.dtype, np.integer) or (EXACT_SCALING and OUT_DW < INP_DW and engine != "pruned")
+    expected_cycles = []
+    expected_outputs = []
+    for cycle in np.arange(num_cycles):
+        if valid[cycle]:
+            model.set_data(int(data[cycle]))
+        model.tick()
+        if model.data_valid():
+            expected_cycles.append(cycle)
+            expected_outputs.append(model.get_data())
+    assert len(expected_cycles) > 0
+    assert list(cycles) == expected_cycles
+    assert list(outputs) == expected_outputs
+    # the model starts the decimation counter on the first input of the block grid (the input R - 1 like the hdl
+    # if R > 1 and N > 1) and it has a shorter output pipeline than the hdl, both are fixed offsets, the output
+    # data are the outputs of the gapless stream
+    first_out = (N - 1) + (R - 2) % R - model.delay
+    latency = model.extra_delay + model.extra_delay_2 - 2
+    hdl_latency = 2 * N + 2
+    reference_cycles = hdl_valid_reference(R, N, np.concatenate((valid, np.zeros(hdl_latency, dtype=bool))), counter=R - 1 - first_out)
+    reference_cycles = reference_cycles - (hdl_latency - latency)
+    reference_cycles = reference_cycles[reference_cycles < num_cycles]
+    # process_block() waits for delay further inputs before it returns an output, they do not change it
+    reference_outputs = model.process_block(np.concatenate((data[valid], np.zeros(model.delay, dtype=data.dtype))))
+    assert list(cycles) == list(reference_cycles)
+    assert list(outputs) == list(reference_outputs[:len(cycles)])
+    # every output of the valid inputs appears, also after the last one
+    valid_cycles = np.flatnonzero(valid)
+    if valid_cycles[-1] + latency < num_cycles:
+        assert len(cycles) == (len(valid_cycles) - 1 - first_out) // R + 1
+
+@pytest.mark.parametrize("R", [10, 33])
+@pytest.mark.parametrize("N", [3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("INP_DW", [16])
+@pytest.mark.parametrize("OUT_DW", [16])
+@pytest.mark.parametrize("EXACT_SCALING", [0, 1])
+@pytest.mark.parametrize("engine", ["recursive", "polyphase", "pruned"])
+@pytest.mark.parametrize("layout", ["channel_major", "sample_major"])
+def test_process_schedule(R, N, M, INP_DW, OUT_DW, EXACT_SCALING, engine, layout):
+    samples = np.stack([generate_input(60 * R, INP_DW, seed=30 + i) for i in np.arange(2)])
+    rng = np.random.default_rng(31)
+    starts = np.sort(rng.choice(np.arange(1, samples.shape[-1]), 8, replace=False))
+    schedule = [(start, int(rng.integers(1, R + 1))) for start in starts]
+    # a rate that is used twice and a segment without samples
+    schedule[3] = (schedule[3][0], schedule[1][1])
+    schedule.append((samples.shape[-1], 2))
+    model = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 1, EXACT_SCALING, engine=engine, layout=layout, verbose=False)
+    if layout == "sample_major":
+        output, offsets = model.process_schedule(samples.T, schedule)
+        output = output.T
+    else:
+        output, offsets = model.process_schedule(samples, schedule)
+    assert model.R == 2
+    expected = [cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 1, EXACT_SCALING, engine=engine, verbose=False).process_block(samples[:, :starts[0]])]
+    for (start, rate), end in zip(schedule, list(starts[1:]) + [samples.shape[-1]] * 2):
+        model_rate = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 1, EXACT_SCALING, engine=engine, verbose=False)
+        model_rate.set_rate(rate)
+        expected.append(model_rate.process_block(samples[:, start:end]))
+    assert list(offsets) == list(np.cumsum([0] + [block.shape[-1] for block in expected[:-1]]))
+    assert np.array_equal(output, np.concatenate(expected, axis=-1))
@@ -0,0 +1,62 @@
+import pytest
+import numpy as np
+from helpers import load
+
+cic_frequency_response = load("cic_frequency_response", "../tools/cic_frequency_response.py")
+cic_d_model = load("cic_d_model", "../model/cic_d_model.py")
+
+@pytest.mark.parametrize("R", [2, 10, 64])
+@pytest.mark.parametrize("N", [1, 3, 6])
+@pytest.mark.parametrize("M", [1, 2])
+def test_cic_response(R, N, M):
+    # magnitude of the dft of the equivalent FIR filter
+    h = np.ones(R * M)
+    for i in np.arange(N - 1):
+        h = np.convolve(h, np.ones(R * M))
+    f = np.linspace(0, 0.5, 101)
+    H = np.abs(np.exp(-2j * np.pi * np.outer(f, np.arange(len(h)))) @ h) / (R * M)**N
+    assert np.allclose(cic_frequency_response.cic_response(f, R, N, M), H)
+
+@pytest.mark.parametrize("R", [2, 5, 64])
+@pytest.mark.parametrize("N", [1, 4])
+@pytest.mark.parametrize("M", [1, 2, 3])
+@pytest.mark.parametrize("passband", [0.1, 0.25, 0.45])
+def test_alias_rejection(R, N, M, passband):
+    fp = passband / R
+    # all alias bands on a fine grid
+    f = (np.arange(1, R)[:, np.newaxis] / R + np.linspace(-fp, fp, 2001)).ravel()
+    f = f[(f > 0) & (f <= 0.5)]
+    expected = -20 * np.log10(np.max(cic_frequency_response.cic_response(f, R, N, M)))
+    assert abs(cic_frequency_response.cic_alias_rejection(fp, R, N, M, num_points=2001) - expected) < 1e-4
+    assert abs(cic_frequency_response.cic_droop(fp, R, N, M) + 20 * np.log10(cic_frequency_response.cic_response(fp, R, N, M))) < 1e-9
+
+def test_broadcast():
+    R, N, M = np.meshgrid([4, 16, 4095], [3, 6], [1, 2], indexing="ij")
+    fp = 0.4 / R
+    droop = cic_frequency_response.cic_droop(fp, R, N, M)
+    rejection = cic_frequency_response.cic_alias_rejection(fp, R, N, M)
+    assert droop.shape == rejection.shape == R.shape
+    for index in np.ndindex(R.shape):
+        assert droop[index] == cic_frequency_response.cic_droop(fp[index], R[index], N[index], M[index])
+        assert rejection[index] == cic_frequency_response.cic_alias_rejection(fp[index], R[index], N[index], M[index])
+    # the second call comes from the cache
+    assert cic_frequency_response.cic_alias_rejection(fp, R, N, M) is rejection
+    assert cic_frequency_response.cic_response(np.linspace(0, 0.5, 11)[:, np.newaxis], 16, [3, 6], 1).shape == (11, 2)
+
+# the model attenuates a tone like the analytic response
+@pytest.mark.parametrize("R", [8, 10])
+@pytest.mark.parametrize("N", [3, 5])
+@pytest.mark.parametrize("f", [0.02, 0.09, 0.115])
+def test_model_response(R, N, f):
+    model = cic_d_model.Model(R, N, 1, 24, 24, 0, 0, engine="recursive", verbose=False)
+    n = np.arange(400 * R)
+    output = model.process_block(np.round(2**20 * np.cos(2 * np.pi * f * n)).astype(np.int64))
+    # the output has (R**N).bit_length() more bits than the input minus the 0 bits of OUT_DW - INP_DW
+    gain = 2.0**int(model.Num_Output_Bits_Without_Truncation - 24) / (R**N)
+    settled = output[len(output) // 2:]
+    t = np.arange(len(settled))
+    # amplitude of the (aliased) tone with a least squares fit
+    basis = np.stack((np.cos(2 * np.pi * f * R * t), np.sin(2 * np.pi * f * R * t), np.ones(len(t))), axis=-1)
+    a = np.linalg.lstsq(basis, settled, rcond=None)[0]
+    amplitude = np.hypot(a[0], a[1]) * gain / 2**20
+    assert abs(amplitude - cic_frequency_response.cic_response(f, R, N, 1)) < 1e-3
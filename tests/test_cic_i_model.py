@@ -0,0 +1,64 @@
+import pytest
+import numpy as np
+from helpers import load, generate_input, wrap_int
+
+cic_i_model = load("cic_i_model", "../model/cic_i_model.py", register=True)
+
+# one clock per output sample with zero-stuffed input, like the hdl without pipeline delay
+def run_reference(model, samples):
+    combs = [[0] * model.g for i in range(model.m)]
+    integrators = [0] * model.m
+    output = []
+    for sample in samples:
+        value = int(sample)
+        for i in range(model.m):
+            delayed = combs[i].pop(0)
+            combs[i].append(value)
+            value = wrap_int(value - delayed, model.comb_widths[i])
+        for clock in range(model.r):
+            upsample = value if clock == 0 else 0
+            for j in range(model.m):
+                idw = model.integrator_inp_widths[j]
+                odw = model.integrator_out_widths[j]
+                integrators[j] = wrap_int(integrators[j] + wrap_int(upsample, idw), max(idw, odw))
+                upsample = integrators[j] >> max(idw - odw, 0)
+            output.append(wrap_int(upsample, model.out_dw))
+    return output
+
+@pytest.mark.parametrize("dw", [8, 16])
+@pytest.mark.parametrize("r", [1, 2, 5, 16])
+@pytest.mark.parametrize("m", [1, 3, 6])
+@pytest.mark.parametrize("g", [1, 2])
+def test_process_block(dw, r, m, g):
+    samples = generate_input(50, dw)
+    model = cic_i_model.Model(dw, r, m, g)
+    output = model.process_block(samples)
+    assert len(output) == len(samples) * r
+    assert list(output) == run_reference(model, samples)
+
+@pytest.mark.parametrize("dw", [16])
+@pytest.mark.parametrize("r", [4096])
+@pytest.mark.parametrize("m", [3, 6])
+@pytest.mark.parametrize("g", [1])
+def test_process_block_wide(dw, r, m, g):
+    samples = generate_input(8, dw)
+    model = cic_i_model.Model(dw, r, m, g)
+    assert list(model.process_block(samples)) == run_reference(model, samples)
+
+@pytest.mark.parametrize("dw", [16])
+@pytest.mark.parametrize("r", [3, 4096])
+@pytest.mark.parametrize("m", [3, 6])
+@pytest.mark.parametrize("g", [1, 2])
+@pytest.mark.parametrize("num_channels", [1, 3])
+def test_stream(dw, r, m, g, num_channels):
+    samples = np.stack([generate_input(60, dw, seed=30 + i) for i in np.arange(num_channels)])
+    model = cic_i_model.Model(dw, r, m, g)
+    output = model.process_block(samples)
+    rng = np.random.default_rng(31)
+    bounds = np.sort(rng.integers(0, samples.shape[-1], 6))
+    model.reset()
+    output_stream = np.concatenate(list(model.stream(np.split(samples, bounds, axis=-1))), axis=-1)
+    assert output.shape == (num_channels, samples.shape[-1] * r)
+    assert np.array_equal(output_stream, output)
+    for i in np.arange(num_channels):
+        assert np.array_equal(output[i], cic_i_model.Model(dw, r, m, g).process_block(samples[i]))
@@ -0,0 +1,28 @@
+import pytest
+import numpy as np
+from helpers import load
+
+decimation_planner = load("decimation_planner", "../tools/decimation_planner.py")
+
+@pytest.mark.parametrize("ratio", [1, 8, 64])
+@pytest.mark.parametrize("max_stages", [1, 3, 6])
+def test_factor_chains(ratio, max_stages):
+    chains = decimation_planner.factor_chains(ratio, (2, 4), max_stages)
+    assert len(set(chains)) == len(chains)
+    for chain in chains:
+        assert np.prod(chain, dtype=int) == ratio and len(chain) <= max_stages
+
+@pytest.mark.parametrize("R_total", [8, 64, 4096])
+@pytest.mark.parametrize("passband", [0.2, 0.4])
+def test_plan_decimation(R_total, passband):
+    plans = decimation_planner.enumerate_plans(R_total, passband, 16, 16)
+    plan = decimation_planner.plan_decimation(R_total, passband, 16, 16)
+    assert plan is not None
+    assert plan["R"] * np.prod([stage["D"] for stage in plan["fir_stages"]], dtype=int) == R_total
+    assert plan["alias_rejection_db"] >= 80
+    # there is no cheaper plan that meets the spec
+    assert all(other["ops"] >= plan["ops"] for other in plans if other["meets_spec"])
+    # a plan with only a CIC must stay within the droop
+    for other in plans:
+        if other["meets_spec"] and len(other["fir_stages"]) == 0:
+            assert other["droop_db"] <= 0.5
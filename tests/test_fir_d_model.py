@@ -0,0 +1,59 @@
+import pytest
+import numpy as np
+from helpers import load, generate_input, wrap_int
+
+fir_d_model = load("fir_d_model", "../model/fir_d_model.py")
+cic_d_model = load("cic_d_model", "../model/cic_d_model.py")
+design_compensation_fir = load("design_compensation_fir", "../tools/design_compensation_fir.py")
+
+@pytest.mark.parametrize("D", [1, 2, 4])
+@pytest.mark.parametrize("num_taps", [1, 7, 31])
+@pytest.mark.parametrize("INP_DW", [16, 40])
+@pytest.mark.parametrize("num_channels", [1, 3])
+def test_process_block(D, num_taps, INP_DW, num_channels):
+    coefficients = generate_input(num_taps, 18, seed=31)
+    samples = np.stack([generate_input(200, INP_DW, seed=30 + i) for i in np.arange(num_channels)])
+    model = fir_d_model.Model(coefficients, D, INP_DW, 24, shift=INP_DW - 6)
+    output = model.process_block(samples)
+    for i in np.arange(num_channels):
+        full = np.convolve(samples[i].astype(object), coefficients.astype(object))[:samples.shape[-1]:D]
+        assert list(output[i]) == [wrap_int(int(value) >> (INP_DW - 6), 24) for value in full]
+    rng = np.random.default_rng(32)
+    bounds = np.sort(rng.integers(0, samples.shape[-1], 8))
+    model.reset()
+    output_stream = np.concatenate(list(model.stream(np.split(samples, bounds, axis=-1))), axis=-1)
+    assert np.array_equal(output_stream, output)
+
+@pytest.mark.parametrize("R", [8, 64])
+@pytest.mark.parametrize("N", [3, 5])
+@pytest.mark.parametrize("M", [1, 2])
+@pytest.mark.parametrize("D", [2, 4])
+def test_compensation(R, N, M, D):
+    passband = 0.4 / D
+    h = design_compensation_fir.design_compensation_fir(R, N, M, 32 * D - 1, passband, D=D)
+    f = np.linspace(0, 0.5, 1001)
+    H = np.abs(np.exp(-2j * np.pi * np.outer(f, np.arange(len(h)))) @ h)
+    total = H * design_compensation_fir.cic_frequency_response.cic_response(f / R, R, N, M)
+    # flat passband and the aliases of the decimation are attenuated
+    assert np.max(np.abs(20 * np.log10(total[f <= passband]))) < 0.1
+    assert np.max(20 * np.log10(H[f >= 1 / D - passband])) < -40
+    coefficients, shift = design_compensation_fir.quantize_coefficients(h, 18)
+    assert np.max(np.abs(coefficients)) < 2**17 and np.max(np.abs(coefficients)) >= 2**16
+    assert np.allclose(coefficients / 2**shift, h, atol=2.0**-shift)
+
+# the FIR stage decimates the CIC output, a tone in the passband keeps its amplitude
+@pytest.mark.parametrize("R", [16])
+@pytest.mark.parametrize("N", [4])
+@pytest.mark.parametrize("D", [2, 4])
+def test_chain(R, N, D):
+    INP_DW = 16
+    passband = 0.4 / D
+    coefficients, shift = design_compensation_fir.quantize_coefficients(design_compensation_fir.design_compensation_fir(R, N, 1, 63, passband, D=D), 18)
+    cic = cic_d_model.Model(R, N, 1, INP_DW, 24, 0, 0, engine="recursive", verbose=False)
+    fir = fir_d_model.Model(coefficients, D, 24, 24, shift=shift)
+    f = passband * 0.9 / R
+    samples = np.round(2**(INP_DW - 2) * np.cos(2 * np.pi * f * np.arange(200 * R * D))).astype(np.int64)
+    output = fir.process_block(cic.process_block(samples))
+    # settled part, the CIC output has 24 - 16 more bits than the input if R**N is a power of 2
+    amplitude = np.max(np.abs(output[len(output) // 2:])) / 2**(24 - INP_DW)
+    assert abs(20 * np.log10(amplitude / 2**(INP_DW - 2))) < 0.2
@@ -0,0 +1,87 @@
+import pytest
+import numpy as np
+from scipy import signal
+from helpers import load, generate_input
+from spectral_estimation import PSD, WelchPSD, stream_spectra
+
+cic_d_model = load("cic_d_model", "../model/cic_d_model.py")
+
+# power of the window relative to its coherent gain (equivalent noise bandwidth in bins)
+def enbw(window, nperseg):
+    w = signal.get_window(window, nperseg)
+    return nperseg * np.sum(w**2) / np.sum(w)**2
+
+@pytest.mark.parametrize("nperseg", [256, 255])
+@pytest.mark.parametrize("noverlap", [None, 0, 200])
+@pytest.mark.parametrize("window", ["hann", "boxcar"])
+def test_noise_level(nperseg, noverlap, window):
+    x = np.random.default_rng(30).standard_normal(20000)
+    psd = WelchPSD(nperseg, window=window, noverlap=noverlap, fs=10)
+    # chunks that do not fit the segments
+    for chunk in np.array_split(x, 37):
+        psd.push(chunk)
+    S, freq = psd.result()
+    freq_welch, S_welch = signal.welch(x, fs=10, window=window, nperseg=nperseg, noverlap=noverlap, detrend=False, scaling='density')
+    assert np.allclose(freq, freq_welch)
+    # scipy normalizes with the noise bandwidth of the window and doubles the one sided bins,
+    # PSD() normalizes with the coherent gain and doubles the amplitude
+    factor = np.full(len(S), 2 * enbw(window, nperseg))
+    factor[0] /= 2
+    if nperseg % 2 == 0:
+        factor[-1] /= 2
+    assert np.allclose(S, S_welch * factor, rtol=1e-10, atol=0)
+    # white noise with variance 1 has the density 2 / fs in the bins between dc and nyquist
+    assert np.mean(S_welch[1:-1]) == pytest.approx(2 / 10, rel=0.05)
+
+@pytest.mark.parametrize("bin", [10, 37])
+def test_tone(bin):
+    nperseg = 256
+    amplitude = 0.3
+    t = np.arange(10 * nperseg)
+    psd = WelchPSD(nperseg, fs=1, scaling='ps')
+    psd.push(amplitude * np.sin(2 * np.pi * bin / nperseg * t))
+    S, freq = psd.result()
+    assert np.argmax(S) == bin
+    assert freq[bin] == pytest.approx(bin / nperseg)
+    # same scaling as PSD() for one segment, the peak is the squared amplitude
+    assert S[bin] == pytest.approx(amplitude**2, rel=1e-9)
+    S_single, _ = PSD(amplitude * np.sin(2 * np.pi * bin / nperseg * t[:nperseg]), window='hann', scaling='ps')
+    assert S[bin] == pytest.approx(S_single[bin], rel=1e-9)
+
+@pytest.mark.parametrize("nperseg", [256, 255])
+@pytest.mark.parametrize("window", ["hann", "boxcar"])
+def test_one_sided(nperseg, window):
+    x = np.random.default_rng(30).standard_normal(64 * nperseg)
+    # one segment is PSD() of the segment, dc and nyquist are not doubled in both
+    psd = WelchPSD(nperseg, window=window, fs=10)
+    psd.push(x[:nperseg])
+    S, freq = psd.result()
+    S_single, freq_single = PSD(x[:nperseg], window=window, fs=10)
+    assert np.allclose(freq, freq_single)
+    assert np.allclose(S, S_single, rtol=1e-10, atol=0)
+    # white noise has the same total power in both estimates
+    psd = WelchPSD(nperseg, window=window, fs=10)
+    psd.push(x)
+    S, freq = psd.result()
+    S_whole, freq_whole = PSD(x, window=window, fs=10)
+    assert np.sum(S) * freq[1] == pytest.approx(np.sum(S_whole) * freq_whole[1], rel=0.02)
+
+def test_too_short():
+    psd = WelchPSD(256)
+    psd.push(np.zeros(255))
+    with pytest.raises(AssertionError):
+        psd.result()
+
+@pytest.mark.parametrize("engine", ["recursive", "polyphase"])
+def test_stream_spectra(engine):
+    R, N, M, INP_DW, OUT_DW = 10, 3, 1, 16, 16
+    samples = generate_input(100 * 1024, INP_DW)
+    model = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, 0, engine=engine, verbose=False)
+    (S_input, freq_input), (S_output, freq) = stream_spectra(model, np.array_split(samples, 13), 512, fs=R)
+    # same as the spectra of the whole signals
+    output = cic_d_model.Model(R, N, M, INP_DW, OUT_DW, 0, 0, engine=engine, verbose=False).process_block(samples)
+    for x, S, fs in [(samples, S_input, R), (output, S_output, 1)]:
+        psd = WelchPSD(512, fs=fs)
+        psd.push(x)
+        assert np.allclose(psd.result()[0], S)
+    assert freq[-1] == pytest.approx(0.5)
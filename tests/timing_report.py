@@ -0,0 +1,42 @@
+import os
+import sys
+import json
+
+# prints the run time of every configuration for every simulator side by side, e.g. after
+#   pytest --workers 10 tests/test_cic_d.py
+#   SIM=verilator pytest --workers 10 tests/test_cic_d.py
+#   python tests/timing_report.py
+# the times include compilation, unless the build was reused from sim_build, but not the time spent waiting
+# for the build lock of another worker
+
+def load_timings(file_name):
+    timings = {}
+    with open(file_name) as f:
+        for line in f:
+            run = json.loads(line)
+            # the LUT file name is not interesting, the long PRUNE_BITS number is shortened
+            parameters = {k: v for k, v in run["parameters"].items() if k != "SCALING_LUT_FILE"}
+            if "PRUNE_BITS" in parameters:
+                parameters["PRUNE_BITS"] = "calc"
+            config = run["testcase"] + " " + " ".join(f"{k}={v}" for k, v in parameters.items())
+            # the latest run of a configuration counts
+            timings.setdefault(config, {})[run["simulator"]] = run["seconds"]
+    return timings
+
+def print_report(timings):
+    simulators = sorted({simulator for runs in timings.values() for simulator in runs})
+    width = max(len(config) for config in timings)
+    header = f"{'configuration':<{width}}" + "".join(f"{simulator:>12}" for simulator in simulators)
+    if "icarus" in simulators and "verilator" in simulators:
+        header += f"{'speedup':>10}"
+    print(header)
+    for config in sorted(timings):
+        runs = timings[config]
+        line = f"{config:<{width}}" + "".join(f"{runs[simulator]:>11.1f}s" if simulator in runs else f"{'-':>12}" for simulator in simulators)
+        if "icarus" in runs and "verilator" in runs:
+            line += f"{runs['icarus'] / runs['verilator']:>9.1f}x"
+        print(line)
+
+if __name__ == "__main__":
+    file_name = sys.argv[1] if len(sys.argv) > 1 else os.path.join("sim_build", "timing.jsonl")
+    print_report(load_timings(file_name))
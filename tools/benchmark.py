@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import time
+import pickle
+import platform
+import argparse
+import itertools
+import importlib.util
+import numpy as np
+
+tools_dir = os.path.abspath(os.path.dirname(__file__))
+model_dir = os.path.abspath(os.path.join(tools_dir, '../model/cic_d_model.py'))
+spec = importlib.util.spec_from_file_location("cic_d_model", model_dir)
+cic_d_model = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = cic_d_model
+spec.loader.exec_module(cic_d_model)
+spec = importlib.util.spec_from_file_location("calculate_register_pruning", os.path.join(tools_dir, "calculate_register_pruning.py"))
+calculate_register_pruning = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(calculate_register_pruning)
+
+GRID = dict(R=[10, 100, 4095], N=[3, 6], M=[1, 2], INP_DW=[16, 32])
+ENGINES = ["taps", "recursive", "polyphase", "pruned"]
+
+# calls func(num) with increasing num until it takes at least min_time, returns num per second
+def measure_rate(func, min_time, num=16):
+    while True:
+        start = time.perf_counter()
+        func(num)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return num / elapsed
+        num *= 2 if elapsed <= 0 else max(2, min(int(min_time / elapsed * 1.2) + 1, 64))
+
+def measure_time(func, min_time):
+    return 1 / measure_rate(lambda num: [func() for i in range(num)], min_time, num=1)
+
+def new_model(R, N, M, INP_DW, engine):
+    return cic_d_model.Model(R, N, M, INP_DW, INP_DW, 0, 0, engine=engine, verbose=False)
+
+def run_benchmarks(grid, engines, min_time):
+    rng = np.random.default_rng(30)
+    results = []
+    def add(name, value, unit, higher_is_better, **parameters):
+        results.append(dict(name=name, **parameters, value=value, unit=unit, higher_is_better=higher_is_better))
+        print(f"{name:<28} {' '.join(f'{k}={v}' for k, v in parameters.items()):<32} {value:14.6g} {unit}")
+
+    for R, N, M, INP_DW in itertools.product(grid["R"], grid["N"], grid["M"], grid["INP_DW"]):
+        parameters = dict(R=R, N=N, M=M, INP_DW=INP_DW)
+        add("calculate_register_pruning", measure_time(
+            lambda: calculate_register_pruning.calculate_register_pruning_uncached(R, N, M, INP_DW, INP_DW), min_time),
+            "s", False, **parameters)
+        for engine in engines:
+            model = new_model(R, N, M, INP_DW, engine)
+            add(f"state_size_initial/{engine}", len(pickle.dumps(model)), "bytes", False, **parameters)
+
+            def tick(num):
+                for sample in rng.integers(-2**(INP_DW-1), 2**(INP_DW-1), num):
+                    model.set_data(int(sample))
+                    model.tick()
+            add(f"tick/{engine}", measure_rate(tick, min_time), "samples/s", True, **parameters)
+
+            # at least a few outputs per block
+            samples = rng.integers(-2**(INP_DW-1), 2**(INP_DW-1), max(2**16, 16 * R))
+            add(f"process_block/{engine}", len(samples) / measure_time(lambda: model.process_block(samples), min_time),
+                "samples/s", True, **parameters)
+            # the tick state and the block state of push() (history ring, integrators and combs) are filled now
+            add(f"state_size/{engine}", len(pickle.dumps(model)), "bytes", False, **parameters)
+    return results
+
+# returns the results that are worse than the baseline by more than threshold (relative)
+def compare(results, baseline, threshold):
+    key = lambda result: tuple((k, v) for k, v in result.items() if k not in ("value", "unit", "higher_is_better"))
+    baseline = {key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        if key(result) not in baseline:
+            continue
+        old = baseline[key(result)]["value"]
+        ratio = result["value"] / old if result["higher_is_better"] else old / result["value"]
+        if ratio < 1 - threshold:
+            regressions.append((result, old, ratio))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark of the model engines and the register pruning calculation")
+    parser.add_argument("--output", default="benchmark.json", help="json file for the results")
+    parser.add_argument("--baseline", help="json file of an earlier run, regressions against it are reported")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown that counts as regression")
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum time per measurement in s")
+    parser.add_argument("--engines", nargs="+", default=ENGINES, choices=ENGINES)
+    for name, values in GRID.items():
+        parser.add_argument(f"--{name}", nargs="+", type=int, default=values)
+    args = parser.parse_args()
+
+    grid = {name: getattr(args, name) for name in GRID}
+    results = run_benchmarks(grid, args.engines, args.min_time)
+    info = dict(python=platform.python_version(), numpy=np.__version__, machine=platform.machine(), processor=platform.processor())
+    with open(args.output, "w") as f:
+        json.dump(dict(info=info, results=results), f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for result, old, ratio in regressions:
+            parameters = " ".join(f"{k}={result[k]}" for k in GRID)
+            print(f"REGRESSION {result['name']} {parameters}: {old:.6g} -> {result['value']:.6g} {result['unit']} ({ratio:.2f}x)")
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        sys.exit(1 if regressions else 0)
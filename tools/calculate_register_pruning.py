@@ -1,6 +1,15 @@
 import math
+import os
+import tempfile
+import functools
+import itertools
+import concurrent.futures
 import numpy as np
 
+# results can also be cached on disk, this is off unless CIC_CACHE_DIR is set or disk_cache=True is passed
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cic")
+# increment when the calculation changes its results
+CACHE_VERSION = 1
 
 
 def binom(n, k):
@@ -10,39 +19,133 @@ def binom(n, k):
 
 # this function is not needed for the model
 # TODO: outsource it to a separate file
-def calculate_register_pruning(R, N, M, INP_DW, OUT_DW, clip_Bj=True):
-    # calculate register pruning as described in Hogenauer, 1981
-    CIC_Filter_Gain = (R*M)**N        
-    Num_of_Bits_Growth = np.ceil(math.log2(CIC_Filter_Gain))
-    B_max = Num_of_Bits_Growth + INP_DW   
-    
+# the result only depends on the parameters, it is cached in memory and with disk_cache=True also on disk,
+# the default disk_cache=None uses the disk cache only if CIC_CACHE_DIR is set
+# verbose=False silences the table of all stages
+def calculate_register_pruning(R, N, M, INP_DW, OUT_DW, clip_Bj=True, verbose=True, disk_cache=None):
+    F_j, B_j = cached_register_pruning(R, N, M, INP_DW, OUT_DW, clip_Bj, get_cache_dir(disk_cache))
+    if verbose:
+        CIC_Filter_Gain = (R*M)**N
+        B_max = np.ceil(math.log2(CIC_Filter_Gain)) + INP_DW
+        out_bits = B_max - B_j
+        out_bits[2*N+1] = OUT_DW
+        with np.errstate(divide="ignore"):
+            for j in np.arange(1, 2*N+2):
+                print(f"F_{j} = {F_j[j]:.6f}  \t -log_2(F_j) = {-np.log2(F_j[j]):.6f} \t B_j = {B_j[j]} \t bits = {out_bits[j]}")
+    # the cached array must not be modified by the caller
+    return B_j.copy()
+
+# directory of the disk cache, None if it is not used
+def get_cache_dir(disk_cache=None):
+    if disk_cache is None:
+        disk_cache = bool(os.environ.get("CIC_CACHE_DIR"))
+    if not disk_cache:
+        return None
+    return os.path.join(os.environ.get("CIC_CACHE_DIR") or DEFAULT_CACHE_DIR, "register_pruning")
+
+# in-process cache in front of the disk cache, the disk cache is shared by all processes
+# (e.g. pytest workers), files are written to a temporary name and then renamed, so a reader never
+# sees a partially written file and concurrent writers just write the same result twice
+@functools.lru_cache(maxsize=256)
+def cached_register_pruning(R, N, M, INP_DW, OUT_DW, clip_Bj, cache_dir=None):
+    if cache_dir is None:
+        return calculate_register_pruning_uncached(R, N, M, INP_DW, OUT_DW, clip_Bj)
+    file_name = os.path.join(cache_dir, f"v{CACHE_VERSION}_R{R}_N{N}_M{M}_INP{INP_DW}_OUT{OUT_DW}_clip{int(bool(clip_Bj))}.npy")
+    try:
+        F_j, B_j = np.load(file_name)
+        return F_j, B_j
+    except (OSError, ValueError):
+        pass
+    F_j, B_j = calculate_register_pruning_uncached(R, N, M, INP_DW, OUT_DW, clip_Bj)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.stack((F_j, B_j)))
+        os.replace(tmp_name, file_name)
+    except OSError:
+        # the cache is only an optimization, e.g. the home directory might be read only
+        pass
+    return F_j, B_j
+
+# norm of the impulse response from the input of stage j to the output, F_j in Hogenauer, 1981
+# for the integrator stages j <= N the transfer function is (1 - z^-RM)^N / (1 - z^-1)^(N - j + 1),
+# the impulse response is calculated by repeated cumulative sums of the comb polynomial, starting
+# with the last integrator, this is exact as long as the coefficients fit into int64
+def get_F_j(R, N, M):
     F_j = np.zeros(2*N + 2)
-    for j in np.arange(2*N,0,-1):
-        h_j = np.zeros((R*M-1)*N + 2*N)
-        if j <= N:
-            for k in np.arange((R*M-1)*N + j - 1):
-                for L in range(int(np.floor(k/(R*M))) + 1):
-                    h_j[k] += (-1)**L*binom(N, L)*binom(N - j + k - R*M*L, k - R*M*L)
-        else:
-            for k in np.arange(2*N + 1 - j + 1):
-                h_j[k] = (-1)**k*binom(2*N + 1 - j, k)
+    # largest intermediate coefficient is below (R*M)^(N-1) * 2^N
+    dtype = np.int64 if (R*M)**max(N - 1, 0) * 2**N < 2**63 else object
+    h = np.zeros(R*M*N + 1, dtype=dtype)
+    for L in range(N + 1):
+        h[R*M*L] = (-1)**L*binom(N, L)
+    for j in np.arange(N,0,-1):
+        h = np.cumsum(h, dtype=dtype)
+        # the last coefficient was never included, keep it like that to get the same B_j as before
+        h_j = h[:(R*M-1)*N + j - 1].astype(np.float64)
+        F_j[j] = np.sqrt(np.dot(h_j,h_j))
 
+    for j in np.arange(2*N,N,-1):
+        h_j = np.zeros(2*N + 1 - j + 1)
+        for k in np.arange(2*N + 1 - j + 1):
+            h_j[k] = (-1)**k*binom(2*N + 1 - j, k)
         F_j[j] = np.sqrt(np.dot(h_j,h_j))
 
     F_j[2*N + 1]=1
+    return F_j
+
+def calculate_register_pruning_uncached(R, N, M, INP_DW, OUT_DW, clip_Bj=True):
+    F_j = get_F_j(R, N, M)
+    return F_j, get_B_j(F_j, R, N, M, INP_DW, OUT_DW, clip_Bj)
+
+# B_j for the given F_j, INP_DW and OUT_DW can also be arrays of the same shape, the result has one more axis for j
+def get_B_j(F_j, R, N, M, INP_DW, OUT_DW, clip_Bj=True):
+    # calculate register pruning as described in Hogenauer, 1981
+    CIC_Filter_Gain = (R*M)**N        
+    Num_of_Bits_Growth = np.ceil(math.log2(CIC_Filter_Gain))
+    B_max = Num_of_Bits_Growth + np.asarray(INP_DW)[..., np.newaxis]
+    OUT_DW = np.asarray(OUT_DW)[..., np.newaxis]
 
     Num_of_Output_Bits_Truncated = B_max - OUT_DW
-    sigma = np.sqrt((2**Num_of_Output_Bits_Truncated)**2/12)
+    sigma = np.sqrt((2.0**Num_of_Output_Bits_Truncated)**2/12)
 
-    B_j = np.floor(-np.log2(F_j) + np.log2(sigma) + 0.5*math.log2(6/N));      
+    # F_0 is not used, it is 0
+    with np.errstate(divide="ignore"):
+        B_j = np.floor(-np.log2(F_j) + np.log2(sigma) + 0.5*math.log2(6/N));      
     if clip_Bj:
         B_j = np.clip(B_j, 0, None)
-    out_bits = B_max - B_j
 
     # last items need some special treatment
-    B_j[2*N+1] = B_max - OUT_DW
-    out_bits[2*N+1] = OUT_DW
+    B_j[..., 2*N+1] = (B_max - OUT_DW)[..., 0]
+    return B_j
+
+# B_j for every combination of the given parameters, every parameter can be a single value or a list
+# F_j only depends on R, N and M, it is calculated once for every combination of them (in a process pool
+# if max_workers is not 1) and then used for all INP_DW and OUT_DW at once
+# returns a structured array with one row per combination and the fields R, N, M, INP_DW, OUT_DW, B_max,
+# B_j and bits (= B_max - B_j, the width of every stage), B_j and bits have 2*max(N)+2 entries, the
+# entries after 2*N+1 are nan
+def calculate_register_pruning_sweep(R, N, M, INP_DW, OUT_DW, clip_Bj=True, max_workers=None):
+    R, N, M, INP_DW, OUT_DW = [np.atleast_1d(x).astype(int) for x in (R, N, M, INP_DW, OUT_DW)]
+    RNM = list(itertools.product(R.tolist(), N.tolist(), M.tolist()))
+    if max_workers == 1 or len(RNM) == 1:
+        F_js = [get_F_j(*x) for x in RNM]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            F_js = list(executor.map(get_F_j, *zip(*RNM)))
 
-    for j in np.arange(1, 2*N+2):
-        print(f"F_{j} = {F_j[j]:.6f}  \t -log_2(F_j) = {-np.log2(F_j[j]):.6f} \t B_j = {B_j[j]} \t bits = {out_bits[j]}")            
-    return B_j
\ No newline at end of file
+    num_j = 2*int(np.max(N)) + 2
+    dtype = [("R", int), ("N", int), ("M", int), ("INP_DW", int), ("OUT_DW", int), ("B_max", int),
+             ("B_j", float, (num_j,)), ("bits", float, (num_j,))]
+    table = np.zeros(len(RNM) * len(INP_DW) * len(OUT_DW), dtype=dtype)
+    table["B_j"] = np.nan
+    table["bits"] = np.nan
+    inp_dw, out_dw = [x.ravel() for x in np.meshgrid(INP_DW, OUT_DW, indexing="ij")]
+    for i, ((R_, N_, M_), F_j) in enumerate(zip(RNM, F_js)):
+        rows = table[i * len(inp_dw):(i + 1) * len(inp_dw)]
+        B_max = int(np.ceil(math.log2((R_*M_)**N_))) + inp_dw
+        B_j = get_B_j(F_j, R_, N_, M_, inp_dw, out_dw, clip_Bj)
+        rows["R"], rows["N"], rows["M"], rows["INP_DW"], rows["OUT_DW"], rows["B_max"] = R_, N_, M_, inp_dw, out_dw, B_max
+        rows["B_j"][:, :2*N_ + 2] = B_j
+        rows["bits"][:, :2*N_ + 2] = B_max[:, np.newaxis] - B_j
+    return table
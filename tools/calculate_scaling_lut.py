@@ -0,0 +1,69 @@
+import os
+import argparse
+import tempfile
+import numpy as np
+
+# hdl helper functions from cic_functions.vh
+def clog2_l(value):
+    return (int(value) - 1).bit_length() if value > 0 else 0
+
+# widths of the LUT entries in cic_d.sv if PRG_SCALING = 0
+def get_scaling_lut_widths(R, N, M, NUM_SHIFT):
+    SCALING_FACTOR_WIDTH = clog2_l(clog2_l((R*M)**N)) + 1
+    EXACT_SCALING_FACTOR_WIDTH = SCALING_FACTOR_WIDTH + NUM_SHIFT + 1
+    return SCALING_FACTOR_WIDTH, EXACT_SCALING_FACTOR_WIDTH
+
+# shift_number and mult_number for all rates 1..R of a cic_d with VAR_RATE = 1, R is the maximum rate
+# (CIC_R in cic_d.sv), the returned arrays are indexed by the rate, index 0 is unused
+# method="fixed_point" gives the same values as the LUT calculation in cic_d.sv (128 bit arithmetic),
+#                      it only makes the gain of all rates equal to the gain of rate R
+# method="float"       calculates the scaling in floating point, this is more exact and what the testbench
+#                      programs if PRG_SCALING = 1
+def calculate_scaling_lut(R, N, M, NUM_SHIFT=None, method="fixed_point"):
+    assert method in ("fixed_point", "float"), f"unknown method {method}"
+    if NUM_SHIFT is None:
+        NUM_SHIFT = 5*N
+    shift_number = np.zeros(R + 1, dtype=np.int64)
+    mult_number = np.zeros(R + 1, dtype=object)
+    if method == "float":
+        rates = np.arange(1, R + 1)
+        gain_factor_log2 = N * np.log2(2**np.ceil(np.log2(R)) / rates)
+        shift_number[1:] = np.floor(gain_factor_log2)
+        mult_number[1:] = np.floor(2**(gain_factor_log2 - shift_number[1:]) * 2**NUM_SHIFT).astype(np.int64)
+        return shift_number, mult_number
+
+    SCALING_FACTOR_WIDTH, EXACT_SCALING_FACTOR_WIDTH = get_scaling_lut_widths(R, N, M, NUM_SHIFT)
+    rates = np.arange(1, R + 1, dtype=object)
+    gain_diff = (((R << (NUM_SHIFT // N)) // rates) ** N) & ((1 << 128) - 1)
+    # flog2_l() in cic_functions.vh
+    pre_shift = np.array([max(int(x).bit_length() - 1, 0) for x in gain_diff >> NUM_SHIFT], dtype=np.int64)
+    shift_number[1:] = pre_shift & ((1 << SCALING_FACTOR_WIDTH) - 1)
+    mult_number[1:] = (gain_diff >> pre_shift) & ((1 << EXACT_SCALING_FACTOR_WIDTH) - 1)
+    return shift_number, mult_number
+
+# writes the LUT for the SCALING_LUT_FILE parameter of cic_d.sv, one line per rate 1..R,
+# every line is {mult_number, shift_number} in hex like $readmemh expects it
+def write_scaling_lut(file_name, R, N, M, NUM_SHIFT=None, method="fixed_point"):
+    if NUM_SHIFT is None:
+        NUM_SHIFT = 5*N
+    SCALING_FACTOR_WIDTH, EXACT_SCALING_FACTOR_WIDTH = get_scaling_lut_widths(R, N, M, NUM_SHIFT)
+    shift_number, mult_number = calculate_scaling_lut(R, N, M, NUM_SHIFT, method)
+    num_digits = (SCALING_FACTOR_WIDTH + EXACT_SCALING_FACTOR_WIDTH + 3) // 4
+    # written to a temporary file and renamed, so a simulator that reads the file never sees a partial LUT
+    fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_name)), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        for rate in range(1, R + 1):
+            value = (int(mult_number[rate]) << SCALING_FACTOR_WIDTH) | int(shift_number[rate])
+            f.write(f"{value:0{num_digits}x}\n")
+    os.replace(tmp_name, file_name)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="write the scaling LUT of cic_d.sv for VAR_RATE = 1 and PRG_SCALING = 0")
+    parser.add_argument("file_name")
+    parser.add_argument("--R", type=int, required=True, help="maximum rate, CIC_R")
+    parser.add_argument("--N", type=int, required=True)
+    parser.add_argument("--M", type=int, default=1)
+    parser.add_argument("--NUM_SHIFT", type=int, default=None)
+    parser.add_argument("--method", choices=["fixed_point", "float"], default="fixed_point")
+    args = parser.parse_args()
+    write_scaling_lut(args.file_name, args.R, args.N, args.M, args.NUM_SHIFT, args.method)
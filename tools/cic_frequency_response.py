@@ -0,0 +1,68 @@
+import argparse
+import functools
+import numpy as np
+
+# analytic magnitude response of the CIC decimator, all frequencies are relative to the CIC input rate
+# every function broadcasts over arrays of f (or fp), R, N and M, so a whole parameter grid is one NumPy call
+# results are cached, the returned arrays are read only
+
+# magnitude of H(f) = (sin(pi*R*M*f) / (R*M*sin(pi*f)))^N, the dc gain is normalized to 1
+def cic_response(f, R, N, M):
+    return cached(_cic_response, f, R, N, M)
+
+# attenuation in dB at the passband edge fp
+def cic_droop(fp, R, N, M):
+    return cached(_cic_droop, fp, R, N, M)
+
+# attenuation in dB of the worst alias that folds into the passband [0, fp] when the output is decimated by R
+# the aliases come from the bands k/R - fp .. k/R + fp, the band k = 1 has the smallest denominator and
+# the numerator |sin(pi*R*M*f)| is the same in every band, so only 1/R - fp .. 1/R has to be searched,
+# num_points is the resolution of this search (the maximum is at 1/R - fp for M = 1)
+def cic_alias_rejection(fp, R, N, M, num_points=257):
+    return cached(_cic_alias_rejection, fp, R, N, M, num_points)
+
+def _cic_response(f, R, N, M):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h = np.sin(np.pi * R * M * f) / (R * M * np.sin(np.pi * f))
+    # the limit is 1 at f = 0, 1, 2, ...
+    return np.abs(np.where(np.abs(np.sin(np.pi * f)) < 1e-12, 1.0, h))**N
+
+def _cic_droop(fp, R, N, M):
+    with np.errstate(divide="ignore"):
+        return -20 * np.log10(_cic_response(fp, R, N, M))
+
+def _cic_alias_rejection(fp, R, N, M, num_points):
+    t = np.linspace(0, 1, num_points)
+    f = 1 / R[..., np.newaxis] - fp[..., np.newaxis] * t
+    worst = np.max(_cic_response(f, R[..., np.newaxis], N[..., np.newaxis], M[..., np.newaxis]), axis=-1)
+    with np.errstate(divide="ignore"):
+        # without decimation there are no aliases
+        return np.where(R == 1, np.inf, -20 * np.log10(worst))
+
+# the array arguments are broadcast to one shape and used as cache key together with the other arguments
+def cached(func, f, R, N, M, *args):
+    arrays = np.broadcast_arrays(np.asarray(f, dtype=np.float64), np.asarray(R, dtype=np.int64),
+                                 np.asarray(N, dtype=np.int64), np.asarray(M, dtype=np.int64))
+    return _cached(func, args, arrays[0].shape, *(np.ascontiguousarray(array).tobytes() for array in arrays))
+
+@functools.lru_cache(maxsize=256)
+def _cached(func, args, shape, f, R, N, M):
+    ret = func(np.frombuffer(f, dtype=np.float64).reshape(shape), np.frombuffer(R, dtype=np.int64).reshape(shape),
+               np.frombuffer(N, dtype=np.int64).reshape(shape), np.frombuffer(M, dtype=np.int64).reshape(shape), *args)
+    ret = np.asarray(ret)
+    ret.setflags(write=False)
+    return ret[()] if ret.ndim == 0 else ret
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="droop and alias rejection of a CIC decimator")
+    parser.add_argument("--R", type=int, nargs="+", required=True)
+    parser.add_argument("--N", type=int, nargs="+", required=True)
+    parser.add_argument("--M", type=int, nargs="+", default=[1])
+    parser.add_argument("--passband", type=float, default=0.4, help="passband edge as fraction of the output rate")
+    args = parser.parse_args()
+    R, N, M = np.meshgrid(args.R, args.N, args.M, indexing="ij")
+    fp = args.passband / R
+    droop = cic_droop(fp, R, N, M)
+    rejection = cic_alias_rejection(fp, R, N, M)
+    for index in np.ndindex(R.shape):
+        print(f"R = {R[index]}, N = {N[index]}, M = {M[index]}: droop {droop[index]:.3f} dB, alias rejection {rejection[index]:.1f} dB")
@@ -0,0 +1,126 @@
+import os
+import math
+import argparse
+import functools
+import importlib.util
+import numpy as np
+
+tools_dir = os.path.abspath(os.path.dirname(__file__))
+spec = importlib.util.spec_from_file_location("calculate_register_pruning", os.path.join(tools_dir, "calculate_register_pruning.py"))
+calculate_register_pruning = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(calculate_register_pruning)
+spec = importlib.util.spec_from_file_location("cic_frequency_response", os.path.join(tools_dir, "cic_frequency_response.py"))
+cic_frequency_response = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(cic_frequency_response)
+
+# splits a total decimation ratio into a CIC (cic_d.sv with R, N, M) followed by FIR decimators
+# all frequencies are relative to the input sample rate of the chain, the passband is given as a
+# fraction of the output sample rate, e.g. 0.4 means the signal uses 80% of the output nyquist band
+# the estimates are analytic, nothing is simulated:
+# - CIC droop and alias rejection from the magnitude response |sin(pi*R*M*f) / (R*M*sin(pi*f))|^N,
+#   see cic_frequency_response.py, all N and M of a split are evaluated in one call
+# - FIR stages with the tap estimate of fred harris, taps = A / (22 * transition width), the stopband
+#   of every stage starts where its aliases reach the final passband, decimate by 2 stages are halfband
+#   filters (every second coefficient is 0)
+# - if there is a FIR stage, the last one also compensates the CIC droop
+
+# register bits of the pruned CIC, the stage registers and the comb delay lines
+@functools.lru_cache(maxsize=None)
+def cic_register_bits(R, N, M, INP_DW, OUT_DW):
+    B_j = calculate_register_pruning.calculate_register_pruning(R, N, M, INP_DW, OUT_DW, verbose=False)
+    B_max = ((R * M)**N - 1).bit_length() + INP_DW
+    bits = B_max - B_j[1:2*N + 1]
+    return int(np.sum(bits[:N]) + (M + 1) * np.sum(bits[N:]))
+
+# taps of a FIR decimator by D with the given attenuation, fs is the input rate of the stage
+def fir_taps(D, fs, fp, alias_rejection_db):
+    transition = (fs / D - 2 * fp) / fs
+    if transition <= 0:
+        return None
+    return int(math.ceil(alias_rejection_db / (22 * transition))) | 1
+
+# all ordered ways to write ratio as a product of the given factors, with at most max_stages factors
+@functools.lru_cache(maxsize=None)
+def factor_chains(ratio, factors, max_stages):
+    if ratio == 1:
+        return [()]
+    if max_stages == 0:
+        return []
+    return [(factor,) + chain for factor in factors if ratio % factor == 0
+            for chain in factor_chains(ratio // factor, factors, max_stages - 1)]
+
+# scores every chain, returns a list of dicts that is sorted by cost (operations per input sample,
+# then register bits), a multiplication counts as mult_cost additions
+def enumerate_plans(R_total, passband, INP_DW, OUT_DW, alias_rejection_db=80, max_droop_db=0.5, max_compensation_db=6,
+                    N=range(1, 7), M=(1, 2), fir_factors=(2, 4), max_fir_stages=4, mult_cost=4):
+    fp = passband / R_total
+    plans = []
+    fir_ratios = [ratio for ratio in np.arange(1, R_total + 1) if R_total % ratio == 0 and R_total // ratio >= 2]
+    for fir_ratio in fir_ratios:
+        R = R_total // int(fir_ratio)
+        for chain in factor_chains(int(fir_ratio), tuple(fir_factors), max_fir_stages):
+            # FIR stages, the input rate of the first one is the CIC output rate
+            fs = 1 / R
+            fir_ops = 0
+            fir_bits = 0
+            fir_stages = []
+            for D in chain:
+                taps = fir_taps(D, fs, fp, alias_rejection_db)
+                if taps is None:
+                    break
+                # symmetric coefficients, the halfband filter has (taps + 1) / 2 + 1 nonzero coefficients
+                nonzero = (taps + 1) // 2 + 1 if D == 2 else taps
+                mults = (nonzero + 1) // 2
+                fir_ops += (mults * mult_cost + nonzero - 1) * fs / D
+                fir_bits += taps * OUT_DW
+                fir_stages.append(dict(D=D, taps=taps))
+                fs = fs / D
+            else:
+                N_grid, M_grid = np.meshgrid(N, M, indexing="ij")
+                droop = cic_frequency_response.cic_droop(fp, R, N_grid, M_grid)
+                rejection = cic_frequency_response.cic_alias_rejection(fp, R, N_grid, M_grid)
+                for index in np.ndindex(N_grid.shape):
+                    N_, M_ = int(N_grid[index]), int(M_grid[index])
+                    droop_db, cic_rejection_db = float(droop[index]), float(rejection[index])
+                    compensated = len(chain) > 0
+                    plans.append(dict(
+                        R=R, N=N_, M=M_, fir_stages=fir_stages,
+                        droop_db=0.0 if compensated else droop_db, cic_droop_db=droop_db,
+                        alias_rejection_db=min(cic_rejection_db, alias_rejection_db) if compensated else cic_rejection_db,
+                        ops=N_ + N_ / R + fir_ops,
+                        register_bits=cic_register_bits(R, N_, M_, INP_DW, OUT_DW) + fir_bits,
+                        meets_spec=bool(cic_rejection_db >= alias_rejection_db and
+                                        (droop_db <= max_compensation_db if compensated else droop_db <= max_droop_db))))
+    return sorted(plans, key=lambda plan: (plan["ops"], plan["register_bits"]))
+
+# cheapest chain that meets the spec, None if there is none
+def plan_decimation(R_total, passband, INP_DW, OUT_DW, **kwargs):
+    for plan in enumerate_plans(R_total, passband, INP_DW, OUT_DW, **kwargs):
+        if plan["meets_spec"]:
+            return plan
+    return None
+
+def format_plan(plan):
+    chain = f"CIC(R={plan['R']}, N={plan['N']}, M={plan['M']})" + "".join(f" -> FIR(D={stage['D']}, taps={stage['taps']})" for stage in plan["fir_stages"])
+    return f"{chain}: {plan['ops']:.2f} ops/sample, {plan['register_bits']} register bits, droop {plan['droop_db']:.3f} dB (CIC {plan['cic_droop_db']:.3f} dB), alias rejection {plan['alias_rejection_db']:.1f} dB"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="find the cheapest split of a decimation ratio into a CIC and FIR stages")
+    parser.add_argument("R_total", type=int)
+    parser.add_argument("--passband", type=float, default=0.4, help="passband edge as fraction of the output rate")
+    parser.add_argument("--INP_DW", type=int, default=16)
+    parser.add_argument("--OUT_DW", type=int, default=16)
+    parser.add_argument("--alias_rejection_db", type=float, default=80)
+    parser.add_argument("--max_droop_db", type=float, default=0.5, help="droop of the CIC if there is no FIR stage")
+    parser.add_argument("--max_compensation_db", type=float, default=6, help="droop that the last FIR stage can compensate")
+    parser.add_argument("--fir_factors", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--max_fir_stages", type=int, default=4)
+    parser.add_argument("--num", type=int, default=10, help="number of plans that are printed")
+    args = parser.parse_args()
+    plans = enumerate_plans(args.R_total, args.passband, args.INP_DW, args.OUT_DW, alias_rejection_db=args.alias_rejection_db,
+                            max_droop_db=args.max_droop_db, max_compensation_db=args.max_compensation_db,
+                            fir_factors=tuple(args.fir_factors), max_fir_stages=args.max_fir_stages)
+    plans = [plan for plan in plans if plan["meets_spec"]]
+    print(f"{len(plans)} plans meet the spec")
+    for plan in plans[:args.num]:
+        print(format_plan(plan))
@@ -0,0 +1,60 @@
+import os
+import math
+import argparse
+import importlib.util
+import numpy as np
+
+tools_dir = os.path.abspath(os.path.dirname(__file__))
+spec = importlib.util.spec_from_file_location("cic_frequency_response", os.path.join(tools_dir, "cic_frequency_response.py"))
+cic_frequency_response = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(cic_frequency_response)
+
+# linear phase FIR filter (odd number of taps) for the output of a CIC with R, N, M that compensates the
+# CIC droop (inverse sinc^N) up to passband and attenuates everything above stopband
+# passband and stopband are relative to the CIC output rate, the default stopband protects the passband
+# from the aliases of a following decimation by D
+# weighted least squares fit on a dense frequency grid, the dc gain of the result is 1
+def design_compensation_fir(R, N, M, num_taps, passband, stopband=None, D=2, stopband_weight=100):
+    assert num_taps % 2 == 1, f"num_taps = {num_taps} has to be odd"
+    if stopband is None:
+        stopband = 1 / D - passband
+    assert 0 < passband < stopband <= 0.5, f"passband = {passband} and stopband = {stopband} do not fit"
+    K = (num_taps - 1) // 2
+    grid_size = 16 * num_taps
+    f_pass = np.linspace(0, passband, grid_size)
+    f_stop = np.linspace(stopband, 0.5, grid_size)
+    # amplitude response of a symmetric filter, h[K] + 2 * sum(h[K + k] * cos(2*pi*f*k))
+    k = np.arange(K + 1)
+    scale = np.where(k == 0, 1, 2)
+    basis = np.concatenate((np.cos(2 * np.pi * np.outer(f_pass, k)) * scale,
+                            np.sqrt(stopband_weight) * np.cos(2 * np.pi * np.outer(f_stop, k)) * scale))
+    desired = np.concatenate((1 / cic_frequency_response.cic_response(f_pass / R, R, N, M), np.zeros(grid_size)))
+    a = np.linalg.lstsq(basis, desired, rcond=None)[0]
+    h = np.concatenate((a[:0:-1], a))
+    return h / np.sum(h)
+
+# integer coefficients for the FIR decimator model, h is approximately coefficients / 2**shift
+# the largest coefficient uses the full signed COEF_DW bits
+def quantize_coefficients(h, COEF_DW):
+    h = np.asarray(h, dtype=float)
+    limit = 2**(COEF_DW - 1) - 1
+    shift = COEF_DW - 1 - math.ceil(math.log2(np.max(np.abs(h))))
+    if np.max(np.round(np.abs(h) * 2.0**shift)) > limit:
+        shift -= 1
+    return np.round(h * 2.0**shift).astype(np.int64), shift
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="design a FIR filter that compensates the droop of a CIC")
+    parser.add_argument("--R", type=int, required=True)
+    parser.add_argument("--N", type=int, required=True)
+    parser.add_argument("--M", type=int, default=1)
+    parser.add_argument("--num_taps", type=int, default=31)
+    parser.add_argument("--passband", type=float, required=True, help="passband edge relative to the CIC output rate")
+    parser.add_argument("--stopband", type=float, default=None, help="stopband edge relative to the CIC output rate")
+    parser.add_argument("--D", type=int, default=2, help="decimation of the FIR stage")
+    parser.add_argument("--COEF_DW", type=int, default=18)
+    args = parser.parse_args()
+    h = design_compensation_fir(args.R, args.N, args.M, args.num_taps, args.passband, args.stopband, args.D)
+    coefficients, shift = quantize_coefficients(h, args.COEF_DW)
+    print(f"shift = {shift}")
+    print("coefficients = " + ", ".join(str(c) for c in coefficients))